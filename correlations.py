@@ -7,9 +7,12 @@ For each period, calculate correlation across all stocks using RANKINGS (not abs
 Reads data from metrics.json (generated by get_metrics.py)
 """
 import json
+import os
+from operator import itemgetter
 import numpy as np
-from scipy.stats import pearsonr, spearmanr, rankdata
-from typing import List, Tuple, Dict, Optional
+from scipy.stats import pearsonr
+from scipy.special import stdtr
+from typing import List, Tuple, Dict, Optional, Iterable, Iterator
 import argparse
 import re
 
@@ -26,6 +29,14 @@ EXCLUDED_KEYS = {
     'forward_return_1y', 'forward_return_3y', 'forward_return_5y', 'forward_return_10y'
 }
 
+# Storage type of the extracted columns. This must stay float64: combine mode joins rows of different
+# metrics on their forward return value, and ranking treats equal values as ties, so rounding the
+# values to a narrower type would merge distinct rows and change the rank correlations.
+COLUMN_DTYPE = np.float64
+
+# Excluded keys that are never needed for analysis (forward returns are kept for evaluation)
+NON_METRIC_KEYS = {'period', 'price', 'dividends', 'total_return'}
+
 # Statistical significance threshold
 SIGNIFICANCE_THRESHOLD = 0.05
 
@@ -86,25 +97,35 @@ class MetricData:
     def __init__(self):
         """
         Initialize empty MetricData structure.
-        Structure: {forward_period: {time_period: {metric_key: [(metric_value, forward_return), ...]}}}
+        Structure: {forward_period: {time_period: {metric_key: (metric_values, forward_returns)}}}
+        where metric_values and forward_returns are aligned COLUMN_DTYPE arrays.
         """
-        self.data: Dict[str, Dict[str, Dict[str, List[Tuple[float, float]]]]] = {
+        self.data: Dict[str, Dict[str, Dict[str, Tuple[np.ndarray, np.ndarray]]]] = {
             period: {} for period in FORWARD_RETURN_PERIODS
         }
         self.metric_keys: List[str] = []
-    
-    def add_data_point(self, forward_period: str, time_period: str, metric_key: str, 
-                      metric_value: float, forward_return: float):
-        """Add a single data point to the structure."""
+        # Sorted time periods of each forward period, rebuilt only after new data is added
+        self._time_periods: Dict[str, List[str]] = {}
+        # Memoized per-time-period correlation stats: {(forward_period, metric_key): [stats, ...]}
+        self._period_correlations: Dict[Tuple[str, str], List[dict]] = {}
+    
+    def add_data_points(self, forward_period: str, time_period: str, metric_key: str,
+                        metric_values: np.ndarray, forward_returns: np.ndarray):
+        """Add the aligned metric/forward return arrays for one time period."""
         if time_period not in self.data[forward_period]:
             self.data[forward_period][time_period] = {}
-        if metric_key not in self.data[forward_period][time_period]:
-            self.data[forward_period][time_period][metric_key] = []
-        self.data[forward_period][time_period][metric_key].append((metric_value, forward_return))
-    
-    def get_pairs(self, forward_period: str, metric_key: str, time_period: Optional[str] = None) -> List[Tuple[float, float]]:
+            self._time_periods.pop(forward_period, None)
+            # A new time period adds a row to the memoized correlations of every metric in this forward period
+            if self._period_correlations:
+                for cache_key in [key for key in self._period_correlations if key[0] == forward_period]:
+                    del self._period_correlations[cache_key]
+        self.data[forward_period][time_period][metric_key] = (metric_values, forward_returns)
+        self._period_correlations.pop((forward_period, metric_key), None)
+    
+    def get_values(self, forward_period: str, metric_key: str,
+                   time_period: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Get all (metric_value, forward_return) pairs for a given forward period and metric.
+        Get the metric values and forward returns for a given forward period and metric.
         
         Args:
             forward_period: Forward return period
@@ -112,128 +133,438 @@ class MetricData:
             time_period: Optional time period filter (if None, returns all time periods)
         
         Returns:
-            List of (metric_value, forward_return) tuples
+            Tuple of (metric_values, forward_returns) arrays, aligned element by element
         """
-        pairs = []
         periods_to_check = [time_period] if time_period else self.data[forward_period].keys()
         
+        metric_chunks = []
+        forward_return_chunks = []
         for tp in periods_to_check:
             if tp in self.data[forward_period] and metric_key in self.data[forward_period][tp]:
-                pairs.extend(self.data[forward_period][tp][metric_key])
+                metric_values, forward_returns = self.data[forward_period][tp][metric_key]
+                metric_chunks.append(metric_values)
+                forward_return_chunks.append(forward_returns)
         
-        return pairs
+        if not metric_chunks:
+            return np.empty(0, dtype=COLUMN_DTYPE), np.empty(0, dtype=COLUMN_DTYPE)
+        if len(metric_chunks) == 1:
+            return metric_chunks[0], forward_return_chunks[0]
+        return np.concatenate(metric_chunks), np.concatenate(forward_return_chunks)
     
     def get_time_periods(self, forward_period: str) -> List[str]:
-        """Get all time periods for a given forward period."""
-        return sorted([p for p in self.data[forward_period].keys() 
-                      if isinstance(p, str) or (isinstance(p, (int, float)) and p != 0)])
+        """Get all time periods for a given forward period (sorted once, then cached)."""
+        if forward_period not in self._time_periods:
+            self._time_periods[forward_period] = sorted([p for p in self.data[forward_period].keys() 
+                                                         if isinstance(p, str) or (isinstance(p, (int, float)) and p != 0)])
+        return self._time_periods[forward_period]
+    
+    def get_period_correlations(self, forward_period: str, metric_key: str) -> List[dict]:
+        """
+        Get the ranked correlation stats of each time period for a forward period and metric.
+        Results are memoized, so ranking and the analysis modes share one computation.
+        
+        Args:
+            forward_period: Forward return period
+            metric_key: Metric key
+        
+        Returns:
+            List of correlation statistics dictionaries (with 'time_period' key) in time period
+            order, for the periods with a valid correlation. The list is shared; do not modify it.
+        """
+        cache_key = (forward_period, metric_key)
+        if cache_key not in self._period_correlations:
+            period_stats = []
+            for time_period in self.get_time_periods(forward_period):
+                metric_values, forward_return_values = self.get_values(forward_period, metric_key, time_period)
+                
+                if len(metric_values) >= 2:
+                    period_stat = calculate_correlations(metric_values, forward_return_values)
+                    
+                    if period_stat.get('ranked_correlation') is not None:
+                        period_stat['time_period'] = time_period
+                        period_stats.append(period_stat)
+            
+            self._period_correlations[cache_key] = period_stats
+        
+        return self._period_correlations[cache_key]
 
 
 # ============================================================================
 # DATA LOADING AND EXTRACTION
 # ============================================================================
 
-def load_data(filename: str = "metrics.json") -> List[dict]:
+def iter_stocks(filename: str = "metrics.json", chunk_size: int = 1 << 20) -> Iterator[dict]:
+    """
+    Stream stock data dictionaries one at a time from a JSON array file (metrics.json).
+    Only the stock currently being decoded is held in memory, never the whole document.
+    
+    Args:
+        filename: Path to JSON file (default: metrics.json)
+        chunk_size: Number of characters read from the file at a time
+    
+    Yields:
+        Stock data dictionaries, in file order
+    
+    Raises:
+        FileNotFoundError: If the file does not exist
+        json.JSONDecodeError: If the file is not a JSON array of objects
+    """
+    decoder = json.JSONDecoder()
+    
+    with open(filename, 'r') as f:
+        buffer = f.read(chunk_size)
+        pos = 0
+        eof = not buffer
+        expect_array_start = True
+        
+        while True:
+            # Skip whitespace and item separators, reading more data as needed
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                buffer = f.read(chunk_size)
+                pos = 0
+                eof = not buffer
+            
+            if pos >= len(buffer):
+                raise json.JSONDecodeError("Unexpected end of data", buffer, pos)
+            
+            if expect_array_start:
+                if buffer[pos] != '[':
+                    raise json.JSONDecodeError("Expecting '['", buffer, pos)
+                pos += 1
+                expect_array_start = False
+                continue
+            
+            if buffer[pos] == ']':
+                return
+            if buffer[pos] != '{':
+                raise json.JSONDecodeError("Expecting object", buffer, pos)
+            
+            # Decode one stock, appending more data while the object is incomplete
+            while True:
+                try:
+                    stock, end = decoder.raw_decode(buffer, pos)
+                    break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    # Grow geometrically so a stock larger than chunk_size is not re-decoded many times
+                    more = f.read(max(chunk_size, len(buffer) - pos))
+                    eof = not more
+                    buffer = buffer[pos:] + more
+                    pos = 0
+            
+            yield stock
+            # Only move past the stock; the consumed data is dropped when the buffer is next refilled
+            pos = end
+
+
+def get_cache_filename(filename: str) -> str:
+    """
+    Get the path of the column cache for a data file
+    
+    Args:
+        filename: Path to JSON data file
+    
+    Returns:
+        Path of the .npz cache stored next to the data file
+    """
+    return filename + ".cache.npz"
+
+
+def get_source_signature(filename: str) -> np.ndarray:
+    """
+    Get the modification time and size of a file, used to check that a cache was built from it
+    
+    Args:
+        filename: Path to the file
+    
+    Returns:
+        Int64 array of [st_mtime_ns, st_size]
+    """
+    st = os.stat(filename)
+    return np.array([st.st_mtime_ns, st.st_size], dtype=np.int64)
+
+
+def load_cached_columns(filename: str) -> Optional[Tuple[int, np.ndarray, Dict[str, np.ndarray]]]:
     """
-    Load stock data from JSON file (metrics.json)
+    Load extracted columns from the cache if it was built from the current data file
+    
+    The cache stores the modification time and size of the data file it was built from, and is
+    only used when both still match exactly (a newer cache is not enough: an older metrics.json
+    restored with its modification time preserved would otherwise reuse stale columns).
+    
+    Args:
+        filename: Path to JSON data file the cache was built from
+    
+    Returns:
+        Tuple of (n_stocks, periods, columns), or None if there is no usable cache
+    """
+    cache_filename = get_cache_filename(filename)
+    try:
+        with np.load(cache_filename) as cache:
+            if not np.array_equal(cache["source"], get_source_signature(filename)):
+                return None
+            n_stocks = int(cache["n_stocks"])
+            periods = cache["periods"].astype(object)
+            columns = {name[len("col_"):]: cache[name] for name in cache.files if name.startswith("col_")}
+        # A cache written with a different column type does not hold the same values; rebuild it
+        if any(column.dtype != COLUMN_DTYPE for column in columns.values()):
+            return None
+        return n_stocks, periods, columns
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def save_cached_columns(filename: str, source: np.ndarray, n_stocks: int, periods: np.ndarray,
+                        columns: Dict[str, np.ndarray]):
+    """
+    Save extracted columns to the cache so later runs can skip parsing the JSON
+    
+    Args:
+        filename: Path to JSON data file the columns were extracted from
+        source: Signature of the data file from before it was read (from get_source_signature)
+        n_stocks: Number of stocks in the data file
+        periods: Period string of each entry
+        columns: Mapping of key -> COLUMN_DTYPE column aligned with periods
+    """
+    cache_filename = get_cache_filename(filename)
+    temp_filename = cache_filename + ".tmp.npz"
+    try:
+        np.savez(temp_filename, source=source, n_stocks=n_stocks, periods=periods.astype(str),
+                 **{f"col_{key}": column for key, column in columns.items()})
+        os.replace(temp_filename, cache_filename)
+    except OSError as e:
+        print(f"Warning: Could not write cache {cache_filename}: {e}")
+
+
+def load_data(filename: str = "metrics.json", use_cache: bool = True) -> Optional[Tuple[int, np.ndarray, Dict[str, np.ndarray]]]:
+    """
+    Load stock data from JSON file (metrics.json) and extract it into columns.
+    The file is streamed stock by stock, so peak memory is the extracted columns
+    plus a single stock rather than the fully parsed document.
+    
+    The extracted columns are cached in an .npz file next to the data file, and reused
+    as long as the data file's modification time and size are unchanged, which skips JSON
+    parsing entirely.
     
     Args:
         filename: Path to JSON file (default: metrics.json)
+        use_cache: Whether to read and write the column cache
         
     Returns:
-        List of stock data dictionaries
+        Tuple of (n_stocks, periods, columns) as returned by extract_columns,
+        or None if the file could not be read
     """
+    if use_cache:
+        cached = load_cached_columns(filename)
+        if cached is not None:
+            return cached
+    
     try:
-        with open(filename, 'r') as f:
-            return json.load(f)
+        # The cache is tied to the data file as it is before reading starts
+        source = get_source_signature(filename)
+        n_stocks, periods, columns = extract_columns(iter_stocks(filename))
     except FileNotFoundError:
         print(f"Error: {filename} not found")
-        return []
+        return None
     except json.JSONDecodeError:
         print(f"Error: Invalid JSON in {filename}")
+        return None
+    
+    if use_cache:
+        save_cached_columns(filename, source, n_stocks, periods, columns)
+    return n_stocks, periods, columns
+
+
+def _to_float(value) -> float:
+    """Convert a numeric JSON value to float, mapping anything else (None, strings) to NaN."""
+    return float(value) if isinstance(value, (int, float)) else np.nan
+
+
+def _to_column(values: list) -> np.ndarray:
+    """
+    Convert a list of JSON values to a COLUMN_DTYPE array, with None becoming NaN.
+    Values are almost always numbers or None, which numpy converts in one bulk call;
+    only a list containing anything else falls back to converting value by value.
+    
+    Args:
+        values: List of JSON values
+    
+    Returns:
+        COLUMN_DTYPE array with one element per value
+    """
+    try:
+        return np.array(values, dtype=COLUMN_DTYPE)
+    except (TypeError, ValueError):
+        return np.fromiter((_to_float(value) for value in values), dtype=COLUMN_DTYPE, count=len(values))
+
+
+def _to_key_columns(entries: List[dict], keys: List[str]) -> List[np.ndarray]:
+    """
+    Convert the given keys of a stock's entries to one COLUMN_DTYPE array per key.
+    Entries written by get_metrics.py carry every key, so all keys of an entry are fetched
+    with a single itemgetter call into one 2D block; entries missing a key fall back to
+    fetching each key separately with None (NaN) for the missing values.
+    
+    Args:
+        entries: List of entry dictionaries of one stock
+        keys: Keys to convert
+    
+    Returns:
+        List of COLUMN_DTYPE arrays aligned with entries, one per key
+    """
+    if not keys:
         return []
+    
+    get_keys = itemgetter(*keys)
+    try:
+        rows = [get_keys(entry) for entry in entries]
+    except KeyError:
+        return [_to_column([entry.get(key) for entry in entries]) for key in keys]
+    
+    try:
+        block = np.array(rows, dtype=COLUMN_DTYPE).reshape(len(entries), len(keys))
+    except (TypeError, ValueError):
+        return [_to_column([row[i] for row in rows] if len(keys) > 1 else rows) for i in range(len(keys))]
+    
+    return [block[:, i] for i in range(len(keys))]
 
 
-def extract_unified_data(data: List[dict], metric_keys: Optional[List[str]] = None) -> MetricData:
+def extract_columns(stocks: Iterable[dict],
+                    keys: Optional[List[str]] = None) -> Tuple[int, np.ndarray, Dict[str, np.ndarray]]:
     """
-    Extract metrics and forward return data into a unified MetricData structure.
+    Flatten the entries of all stocks into one period array plus one COLUMN_DTYPE column per key.
+    Stocks are consumed one at a time, so a streaming iterator is never materialized.
+    Missing and non-numeric values become NaN so that filtering can be done with array masks.
+    
+    Args:
+        stocks: Iterable of stock data dictionaries
+        keys: Keys to extract as numeric columns (if None, every metric and forward
+              return key found in the data is extracted)
+    
+    Returns:
+        Tuple of (n_stocks, periods, columns): periods holds the period string of each entry
+        and columns maps each key to a COLUMN_DTYPE array aligned with periods.
+        Entries without a valid period are dropped.
+    """
+    n_stocks = 0
+    period_chunks = []
+    chunk_sizes = []
+    column_chunks: Dict[str, Dict[int, np.ndarray]] = {key: {} for key in keys or []}
+    
+    for stock in stocks:
+        n_stocks += 1
+        entries = stock.get("data") or ()
+        if not entries:
+            continue
+        raw_periods = [entry.get("period") for entry in entries]
+        
+        # Skip invalid periods
+        valid = np.fromiter((p is not None and p != 0 for p in raw_periods), dtype=bool, count=len(raw_periods))
+        n_valid = int(np.count_nonzero(valid))
+        if n_valid == 0:
+            continue
+        
+        if keys is None:
+            stock_keys = [key for key in dict.fromkeys(k for entry in entries for k in entry)
+                          if key not in NON_METRIC_KEYS]
+        else:
+            stock_keys = keys
+        
+        chunk_index = len(chunk_sizes)
+        for key, column in zip(stock_keys, _to_key_columns(entries, stock_keys)):
+            column_chunks.setdefault(key, {})[chunk_index] = column[valid]
+        
+        period_chunks.append(np.array([str(p) for p, is_valid in zip(raw_periods, valid) if is_valid], dtype=object))
+        chunk_sizes.append(n_valid)
+    
+    periods = np.concatenate(period_chunks) if period_chunks else np.empty(0, dtype=object)
+    
+    # Stocks that lack a key contribute NaN rows to that column
+    columns = {}
+    for key, chunks in column_chunks.items():
+        columns[key] = np.concatenate(
+            [chunks.get(i, np.full(size, np.nan, dtype=COLUMN_DTYPE)) for i, size in enumerate(chunk_sizes)]
+        ) if chunk_sizes else np.empty(0, dtype=COLUMN_DTYPE)
+    
+    return n_stocks, periods, columns
+
+
+def extract_unified_data(periods: np.ndarray, columns: Dict[str, np.ndarray], metric_keys: List[str]) -> MetricData:
+    """
+    Group extracted columns into a unified MetricData structure.
     This is called once and the result is reused across all analysis functions.
     
     Args:
-        data: List of stock data dictionaries
-        metric_keys: List of metric keys to extract (if None, auto-detect from data)
+        periods: Period string of each entry (from extract_columns)
+        columns: Mapping of key -> COLUMN_DTYPE column aligned with periods (from extract_columns)
+        metric_keys: List of metric keys to extract
         
     Returns:
         MetricData object containing all extracted data
     """
     metric_data = MetricData()
-    
-    # Auto-detect metric keys if not provided
-    if metric_keys is None:
-        metric_keys = []
-        for stock in data:
-            for entry in stock.get("data", []):
-                for key, value in entry.items():
-                    if key not in EXCLUDED_KEYS and value is not None and isinstance(value, (int, float)):
-                        if key not in metric_keys:
-                            metric_keys.append(key)
-                break  # Only need to check one entry
-    
     metric_data.metric_keys = metric_keys
     
+    # Sort rows by time period once; the stable sort keeps the original stock order within a period
+    time_periods, period_index = np.unique(periods, return_inverse=True)
+    order = np.argsort(period_index, kind='stable')
+    period_index = period_index[order]
+    
     # Extract data grouped by time period and forward return period
-    for stock in data:
-        for entry in stock.get("data", []):
-            time_period = entry.get("period")
+    for forward_period in FORWARD_RETURN_PERIODS:
+        forward_return_key = get_forward_return_key(forward_period)
+        if forward_return_key not in columns:
+            continue
+        forward_return_column = columns[forward_return_key][order]
+        forward_return_valid = np.isfinite(forward_return_column)
+        
+        for metric_key in metric_keys:
+            if metric_key not in columns:
+                continue
+            metric_column = columns[metric_key][order]
             
-            # Skip invalid periods
-            if time_period is None or time_period == 0:
+            # Keep valid data points (both metric and forward return must be valid)
+            mask = forward_return_valid & np.isfinite(metric_column)
+            group_index = period_index[mask]
+            if group_index.size == 0:
                 continue
             
-            # For each forward return period
-            for forward_period in FORWARD_RETURN_PERIODS:
-                forward_return_key = get_forward_return_key(forward_period)
-                forward_return_value = entry.get(forward_return_key)
-                
-                # For each metric
-                for metric_key in metric_keys:
-                    metric_value = entry.get(metric_key)
-                    
-                    # Add valid data points (both metric and forward return must be valid)
-                    if (metric_value is not None and forward_return_value is not None and 
-                        isinstance(metric_value, (int, float)) and isinstance(forward_return_value, (int, float))):
-                        metric_data.add_data_point(
-                            forward_period, 
-                            str(time_period), 
-                            metric_key, 
-                            float(metric_value), 
-                            float(forward_return_value)
-                        )
+            # Split the masked rows at time period boundaries
+            boundaries = np.flatnonzero(np.diff(group_index)) + 1
+            starts = np.concatenate(([0], boundaries))
+            metric_groups = np.split(metric_column[mask], boundaries)
+            forward_return_groups = np.split(forward_return_column[mask], boundaries)
+            
+            for start, metric_values, forward_returns in zip(starts, metric_groups, forward_return_groups):
+                time_period = time_periods[group_index[start]]
+                metric_data.add_data_points(forward_period, time_period, metric_key,
+                                            metric_values, forward_returns)
     
     return metric_data
 
 
-def detect_available_metrics(data: List[dict]) -> dict:
+def detect_available_metrics(columns: Dict[str, np.ndarray]) -> dict:
     """
     Detect which metrics are available in the data
     
     Args:
-        data: List of stock data dictionaries
+        columns: Mapping of key -> COLUMN_DTYPE column (from extract_columns)
     
     Returns:
         Dictionary mapping metric keys to their display names and descriptions
     """
     available_metrics = {}
     
-    # First, find all potential metric keys by scanning all entries
+    # First, find all metric keys that have at least one numeric value
     all_metric_keys = set()
-    for stock in data:
-        for entry in stock.get("data", []):
-            for key, value in entry.items():
-                if key not in EXCLUDED_KEYS:
-                    # Check if it's a numeric value (could be a metric)
-                    if value is not None and isinstance(value, (int, float)):
-                        all_metric_keys.add(key)
+    for key, column in columns.items():
+        if key not in EXCLUDED_KEYS and not np.isnan(column).all():
+            all_metric_keys.add(key)
     
     # Now check which of these have display names, or create default names
     for metric_key in sorted(all_metric_keys):
@@ -253,7 +584,99 @@ def detect_available_metrics(data: List[dict]) -> dict:
 # ANALYSIS FUNCTIONS
 # ============================================================================
 
-def calculate_correlations(metric_values: List[float], forward_return_values: List[float]) -> dict:
+def pearson_correlation(x: np.ndarray, y: np.ndarray, x_mean: Optional[float] = None,
+                        y_mean: Optional[float] = None, verify: bool = False) -> Tuple[float, float]:
+    """
+    Calculate the Pearson correlation and its two-sided p-value with centered dot products.
+    Equivalent to scipy.stats.pearsonr, but avoids its per-call overhead and the exact
+    beta-distribution p-value by using the t-statistic with n - 2 degrees of freedom.
+    
+    Args:
+        x: First array of values (at least 2 elements)
+        y: Second array of values, aligned with x
+        x_mean: Mean of x if already known (skips a reduction pass over x)
+        y_mean: Mean of y if already known (skips a reduction pass over y)
+        verify: If True, check the result against scipy.stats.pearsonr (debugging only)
+    
+    Returns:
+        Tuple of (correlation, p-value); both are NaN if either input is constant
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = x.size
+    
+    x_centered = x - (x.mean() if x_mean is None else x_mean)
+    y_centered = y - (y.mean() if y_mean is None else y_mean)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = np.dot(x_centered, y_centered) / (np.sqrt(np.dot(x_centered, x_centered)) *
+                                               np.sqrt(np.dot(y_centered, y_centered)))
+        # Rounding can push |r| slightly above 1
+        r = float(np.clip(r, -1.0, 1.0))
+        
+        if n == 2:
+            p = 1.0 if not np.isnan(r) else np.nan
+        else:
+            t = r * np.sqrt((n - 2) / np.float64(1.0 - r * r))
+            p = float(2 * stdtr(n - 2, -abs(t)))
+    
+    if verify:
+        expected_r, expected_p = pearsonr(x, y)
+        assert np.allclose([r, p], [expected_r, expected_p], equal_nan=True), \
+            f"Pearson mismatch: ({r}, {p}) vs scipy ({expected_r}, {expected_p})"
+    
+    return r, p
+
+
+def average_ranks(values: np.ndarray) -> np.ndarray:
+    """
+    Rank values from 1 to n, giving tied values the average of their ranks.
+    Same result as scipy.stats.rankdata(values, method='average'), using one argsort
+    and a scatter instead of rankdata's general dispatch.
+    
+    Args:
+        values: Array of values to rank
+    
+    Returns:
+        Float64 array of ranks aligned with values
+    """
+    values = np.asarray(values)
+    n = values.size
+    order = np.argsort(values, kind='quicksort')
+    sorted_values = values[order]
+    
+    # Start index of each run of equal values in sorted order
+    run_starts = np.flatnonzero(np.concatenate(([True], sorted_values[1:] != sorted_values[:-1])))
+    run_ends = np.append(run_starts[1:], n)
+    
+    # Every element of a run gets the mean of the ranks run_start + 1 .. run_end
+    run_ranks = (run_starts + run_ends + 1) / 2
+    ranks = np.empty(n, dtype=np.float64)
+    ranks[order] = np.repeat(run_ranks, run_ends - run_starts)
+    return ranks
+
+
+def ranked_pearson(x: np.ndarray, y: np.ndarray) -> Tuple[float, float]:
+    """
+    Calculate the Pearson correlation of the ranks of x and y (Spearman rank correlation)
+    and its p-value, ranking and correlating in one step.
+    
+    Ranks run from 1 to n with average ranks for tied values, so both rank arrays have
+    mean (n + 1) / 2 and can be centered without a reduction pass.
+    
+    Args:
+        x: First array of values (at least 2 elements)
+        y: Second array of values, aligned with x
+    
+    Returns:
+        Tuple of (ranked correlation, p-value)
+    """
+    x_ranks = average_ranks(x)
+    y_ranks = average_ranks(y)
+    rank_mean = (x_ranks.size + 1) / 2
+    return pearson_correlation(x_ranks, y_ranks, rank_mean, rank_mean)
+
+
+def calculate_correlations(metric_values: np.ndarray, forward_return_values: np.ndarray) -> dict:
     """
     Calculate correlation statistics between ranked metric values and ranked forward returns
     
@@ -263,8 +686,8 @@ def calculate_correlations(metric_values: List[float], forward_return_values: Li
     - This is equivalent to Spearman rank correlation
     
     Args:
-        metric_values: List of metric values (e.g., ROA or EBIT/PPE)
-        forward_return_values: List of forward return values
+        metric_values: Array of metric values (e.g., ROA or EBIT/PPE); used as is, without copying
+        forward_return_values: Array of forward return values aligned with metric_values
         
     Returns:
         Dictionary with correlation statistics (using ranked correlations)
@@ -278,20 +701,9 @@ def calculate_correlations(metric_values: List[float], forward_return_values: Li
             "error": "Insufficient data points for correlation"
         }
     
-    # Convert to numpy arrays
-    metric_array = np.array(metric_values)
-    forward_return_array = np.array(forward_return_values)
-    
-    # Rank the data before correlating
-    # Rankdata assigns ranks from 1 to n (where n = number of data points)
-    # Average ranks are used for tied values
-    # This converts absolute values to rankings
-    metric_ranks = rankdata(metric_array, method='average')
-    forward_return_ranks = rankdata(forward_return_array, method='average')
-    
     # Calculate correlation on RANKED data (not absolute values)
     # This measures how well the ranking of metrics predicts the ranking of returns
-    ranked_corr, ranked_p = pearsonr(metric_ranks, forward_return_ranks)
+    ranked_corr, ranked_p = ranked_pearson(metric_values, forward_return_values)
     
     return {
         "n_pairs": len(metric_values),
@@ -300,41 +712,55 @@ def calculate_correlations(metric_values: List[float], forward_return_values: Li
     }
 
 
-def calculate_bucket_difference(pairs: List[Tuple[float, float]]) -> Optional[float]:
+def calculate_bucket_medians(metric_values: np.ndarray, forward_returns: np.ndarray) -> Optional[Tuple[float, float]]:
     """
-    Calculate the difference between top 50% and bottom 50% bucket median returns.
-    This is a shared function used by both ranking and buckets mode.
+    Calculate the median forward return of the bottom 50% and top 50% buckets by metric value.
     
     Args:
-        pairs: List of (metric_value, forward_return) tuples
+        metric_values: Array of metric values
+        forward_returns: Array of forward returns aligned with metric_values
     
     Returns:
-        Difference between top and bottom bucket medians, or None if insufficient data
+        Tuple of (bottom_median, top_median), or None if insufficient data
     """
-    if len(pairs) < 2:
+    if len(metric_values) < 2:
         return None
     
-    metric_values = np.array([p[0] for p in pairs])
-    forward_returns = np.array([p[1] for p in pairs])
-    
     # Calculate median to split into top 50% and bottom 50%
     median_metric = np.median(metric_values)
     
-    # Create masks for top and bottom 50%
-    bottom_mask = metric_values <= median_metric
+    # Create mask for top 50%; everything else is the bottom bucket
     top_mask = metric_values > median_metric
     
-    bottom_returns = forward_returns[bottom_mask]
+    bottom_returns = forward_returns[~top_mask]
     top_returns = forward_returns[top_mask]
     
     if len(bottom_returns) > 0 and len(top_returns) > 0:
-        bottom_median = np.median(bottom_returns)
-        top_median = np.median(top_returns)
-        return top_median - bottom_median
+        return np.median(bottom_returns), np.median(top_returns)
     
     return None
 
 
+def calculate_bucket_difference(metric_values: np.ndarray, forward_returns: np.ndarray) -> Optional[float]:
+    """
+    Calculate the difference between top 50% and bottom 50% bucket median returns.
+    This is a shared function used by both ranking and buckets mode.
+    
+    Args:
+        metric_values: Array of metric values
+        forward_returns: Array of forward returns aligned with metric_values
+    
+    Returns:
+        Difference between top and bottom bucket medians, or None if insufficient data
+    """
+    medians = calculate_bucket_medians(metric_values, forward_returns)
+    if medians is None:
+        return None
+    
+    bottom_median, top_median = medians
+    return top_median - bottom_median
+
+
 # ============================================================================
 # RANKING FUNCTIONS
 # ============================================================================
@@ -355,24 +781,9 @@ def rank_metrics_by_correlation(metric_data: MetricData, available_metrics: dict
     
     for metric_key in available_metrics.keys():
         # Calculate correlations for each time period
-        period_correlations = []
-        period_weights = []
-        
-        time_periods = metric_data.get_time_periods(forward_period)
-        
-        for time_period in time_periods:
-            pairs = metric_data.get_pairs(forward_period, metric_key, time_period)
-            
-            if len(pairs) >= 2:
-                metric_values = [p[0] for p in pairs]
-                forward_return_values = [p[1] for p in pairs]
-                
-                period_stat = calculate_correlations(metric_values, forward_return_values)
-                ranked_corr = period_stat.get('ranked_correlation')
-                
-                if ranked_corr is not None:
-                    period_correlations.append(ranked_corr)
-                    period_weights.append(period_stat.get('n_pairs', 0))
+        period_stats = metric_data.get_period_correlations(forward_period, metric_key)
+        period_correlations = [s['ranked_correlation'] for s in period_stats]
+        period_weights = [s.get('n_pairs', 0) for s in period_stats]
         
         # Calculate weighted average correlation
         if period_correlations and period_weights:
@@ -403,8 +814,8 @@ def rank_metrics_by_bucket_difference(metric_data: MetricData, available_metrics
     rankings = []
     
     for metric_key in available_metrics.keys():
-        pairs = metric_data.get_pairs(forward_period, metric_key)
-        difference = calculate_bucket_difference(pairs)
+        metric_values, forward_returns = metric_data.get_values(forward_period, metric_key)
+        difference = calculate_bucket_difference(metric_values, forward_returns)
         rankings.append((metric_key, difference))
     
     # Sort by difference (descending), handling None values
@@ -562,6 +973,8 @@ def print_period_correlations(period_stats: List[dict], metric_name: str):
     # Sort by time period
     sorted_stats = sorted(period_stats, key=lambda x: x.get('time_period', 0))
     
+    # Build all rows first and write them with a single print instead of one print per period
+    lines = []
     for stat in sorted_stats:
         time_period = stat.get('time_period', 'Unknown')
         ranked_corr = stat.get('ranked_correlation')
@@ -571,11 +984,12 @@ def print_period_correlations(period_stats: List[dict], metric_name: str):
         if ranked_corr is not None and p_value is not None:
             is_significant = p_value < SIGNIFICANCE_THRESHOLD
             significance = "Yes" if is_significant else "No"
-            print(f"{str(time_period):<20} {ranked_corr:<15.4f} {p_value:<15.4e} {significance:<15} {n_pairs:<15}")
+            lines.append(f"{str(time_period):<20} {ranked_corr:<15.4f} {p_value:<15.4e} {significance:<15} {n_pairs:<15}")
         else:
-            print(f"{str(time_period):<20} {'N/A':<15} {'N/A':<15} {'N/A':<15} {n_pairs:<15}")
+            lines.append(f"{str(time_period):<20} {'N/A':<15} {'N/A':<15} {'N/A':<15} {n_pairs:<15}")
     
-    print("="*100)
+    lines.append("="*100)
+    print("\n".join(lines))
     
     # Print summary statistics
     valid_correlations = [s.get('ranked_correlation') for s in sorted_stats 
@@ -835,28 +1249,10 @@ def run_average_mode(metric_data: MetricData, available_metrics: dict, metric_ke
     for forward_period in FORWARD_RETURN_PERIODS:
         for metric_key in metric_keys_to_process:
             # Calculate correlations for each time period
-            period_correlations = []
-            period_weights = []  # Sample sizes for weighting
-            period_stats = []  # Store full stats for each period
-            
-            # Get all time periods for this forward return period
-            time_periods = metric_data.get_time_periods(forward_period)
-            
-            for time_period in time_periods:
-                pairs = metric_data.get_pairs(forward_period, metric_key, time_period)
-                
-                if len(pairs) >= 2:
-                    metric_values = [p[0] for p in pairs]
-                    forward_return_values = [p[1] for p in pairs]
-                    
-                    period_stat = calculate_correlations(metric_values, forward_return_values)
-                    ranked_corr = period_stat.get('ranked_correlation')
-                    
-                    if ranked_corr is not None:
-                        period_correlations.append(ranked_corr)
-                        period_weights.append(period_stat.get('n_pairs', 0))
-                        period_stat['time_period'] = time_period
-                        period_stats.append(period_stat)
+            period_stats = metric_data.get_period_correlations(forward_period, metric_key)
+            period_correlations = [s['ranked_correlation'] for s in period_stats]
+            period_pvalues = [s['ranked_pvalue'] for s in period_stats]
+            period_weights = [s.get('n_pairs', 0) for s in period_stats]  # Sample sizes for weighting
             
             # Calculate weighted average correlation across all time periods
             if period_correlations and period_weights:
@@ -866,27 +1262,21 @@ def run_average_mode(metric_data: MetricData, available_metrics: dict, metric_ke
                 
                 # Calculate weighted average p-value (using Fisher's z-transformation would be more accurate,
                 # but for simplicity we'll use weighted average of p-values)
-                period_pvalues = [s.get('ranked_pvalue') for s in period_stats if s.get('ranked_pvalue') is not None]
-                if period_pvalues:
-                    # Weight p-values by sample size (inverse weighting - larger samples get more weight)
-                    pvalues_array = np.array(period_pvalues)
-                    weighted_avg_pvalue = np.average(pvalues_array, weights=weights_array)
-                else:
-                    weighted_avg_pvalue = None
+                # Weight p-values by sample size (inverse weighting - larger samples get more weight)
+                pvalues_array = np.array(period_pvalues)
+                weighted_avg_pvalue = np.average(pvalues_array, weights=weights_array)
                 
                 # Total number of pairs across all periods
                 total_pairs = sum(period_weights)
                 
-                # Create summary stats
+                # Create summary stats (only the aggregates are kept; per-period stats are not needed for display)
                 stats = {
                     'forward_period': forward_period,
                     'metric_key': metric_key,
                     'ranked_correlation': float(weighted_avg_correlation),
-                    'ranked_pvalue': float(weighted_avg_pvalue) if weighted_avg_pvalue is not None else None,
+                    'ranked_pvalue': float(weighted_avg_pvalue),
                     'n_pairs': total_pairs,
-                    'n_periods': len(period_correlations),
-                    'period_correlations': period_correlations,  # Store for reference
-                    'period_stats': period_stats  # Store full period stats
+                    'n_periods': len(period_correlations)
                 }
                 
                 all_results[metric_key][forward_period] = stats
@@ -921,24 +1311,7 @@ def run_by_period_mode(metric_data: MetricData, available_metrics: dict, metric_
     print(f"\nCalculating correlations for each time period (total forward return only)...")
     
     for metric_key in metric_keys_to_process:
-        period_stats = []
-        
-        # Get all time periods for total forward return
-        time_periods = metric_data.get_time_periods(forward_period)
-        
-        for time_period in time_periods:
-            pairs = metric_data.get_pairs(forward_period, metric_key, time_period)
-            
-            if len(pairs) >= 2:
-                metric_values = [p[0] for p in pairs]
-                forward_return_values = [p[1] for p in pairs]
-                
-                period_stat = calculate_correlations(metric_values, forward_return_values)
-                ranked_corr = period_stat.get('ranked_correlation')
-                
-                if ranked_corr is not None:
-                    period_stat['time_period'] = time_period
-                    period_stats.append(period_stat)
+        period_stats = metric_data.get_period_correlations(forward_period, metric_key)
         
         # Display results for this metric
         if period_stats:
@@ -969,29 +1342,20 @@ def run_buckets_mode(metric_data: MetricData, available_metrics: dict, metric_ke
         print("-"*100)
         
         for forward_period in FORWARD_RETURN_PERIODS:
-            pairs = metric_data.get_pairs(forward_period, metric_key)
+            metric_values, forward_returns = metric_data.get_values(forward_period, metric_key)
             
-            if len(pairs) < 2:
+            if len(metric_values) < 2:
                 continue
             
-            # Use shared bucket calculation function
-            difference = calculate_bucket_difference(pairs)
+            # Use shared bucket calculation function (medians are computed once for display and difference)
+            medians = calculate_bucket_medians(metric_values, forward_returns)
             
-            if difference is not None:
-                # Calculate bucket medians for display
-                metric_values = np.array([p[0] for p in pairs])
-                forward_returns = np.array([p[1] for p in pairs])
-                median_metric = np.median(metric_values)
-                bottom_mask = metric_values <= median_metric
-                top_mask = metric_values > median_metric
-                bottom_returns = forward_returns[bottom_mask]
-                top_returns = forward_returns[top_mask]
-                
-                bottom_median = np.median(bottom_returns)
-                top_median = np.median(top_returns)
+            if medians is not None:
+                bottom_median, top_median = medians
+                difference = top_median - bottom_median
                 
                 period_display = format_forward_period_display(forward_period)
-                print(f"{period_display:<20} {bottom_median:<30.2f}% {top_median:<30.2f}% {difference:<20.2f}% {len(pairs):<15,}")
+                print(f"{period_display:<20} {bottom_median:<30.2f}% {top_median:<30.2f}% {difference:<20.2f}% {len(metric_values):<15,}")
         
         print("="*100)
 
@@ -1032,9 +1396,9 @@ def calculate_combined_scores(metric_data: MetricData, metric_items: List[Tuple[
         # Step 1: Get all pairs for all metrics for this time period
         all_metric_pairs = {}
         for metric_key in metric_keys:
-            pairs = metric_data.get_pairs(forward_period, metric_key, time_period)
-            if len(pairs) > 0:
-                all_metric_pairs[metric_key] = pairs
+            metric_values, forward_returns = metric_data.get_values(forward_period, metric_key, time_period)
+            if len(metric_values) > 0:
+                all_metric_pairs[metric_key] = (metric_values, forward_returns)
         
         if not all_metric_pairs or len(all_metric_pairs) < len(metric_keys):
             continue
@@ -1045,16 +1409,14 @@ def calculate_combined_scores(metric_data: MetricData, metric_items: List[Tuple[
         
         for metric_key in metric_keys:
             if metric_key in all_metric_pairs:
-                pairs = all_metric_pairs[metric_key]
-                # Extract just the metric values for ranking
-                metric_values = np.array([p[0] for p in pairs])
+                metric_values, forward_returns = all_metric_pairs[metric_key]
                 # Rank all values for this metric within this time period
-                ranks = rankdata(metric_values, method='average')
+                ranks = average_ranks(metric_values)
                 
                 # Create mapping from (metric_value, forward_return) to rank
                 # This allows us to look up the rank for a specific data point
                 metric_value_to_rank[metric_key] = {}
-                for i, (mv, fr) in enumerate(pairs):
+                for i, (mv, fr) in enumerate(zip(metric_values.tolist(), forward_returns.tolist())):
                     # Use a tuple key that's tolerant of floating point differences
                     key = (round(mv, 10), round(fr, 10))
                     metric_value_to_rank[metric_key][key] = ranks[i]
@@ -1066,7 +1428,8 @@ def calculate_combined_scores(metric_data: MetricData, metric_items: List[Tuple[
         
         for metric_key in metric_keys:
             if metric_key in all_metric_pairs:
-                for metric_value, forward_return in all_metric_pairs[metric_key]:
+                metric_values, forward_returns = all_metric_pairs[metric_key]
+                for metric_value, forward_return in zip(metric_values.tolist(), forward_returns.tolist()):
                     # Round to handle floating point precision issues
                     fr_rounded = round(forward_return, 10)
                     if fr_rounded not in forward_return_groups:
@@ -1144,21 +1507,15 @@ def run_combine_mode(metric_data: MetricData, available_metrics: dict):
         if len(combined_pairs) < 2:
             continue
         
-        # Use shared bucket calculation function
-        difference = calculate_bucket_difference(combined_pairs)
+        combined_scores = np.array([p[0] for p in combined_pairs])
+        forward_returns = np.array([p[1] for p in combined_pairs])
         
-        if difference is not None:
-            # Calculate bucket medians for display
-            combined_scores = np.array([p[0] for p in combined_pairs])
-            forward_returns = np.array([p[1] for p in combined_pairs])
-            median_score = np.median(combined_scores)
-            bottom_mask = combined_scores <= median_score
-            top_mask = combined_scores > median_score
-            bottom_returns = forward_returns[bottom_mask]
-            top_returns = forward_returns[top_mask]
-            
-            bottom_median = np.median(bottom_returns)
-            top_median = np.median(top_returns)
+        # Use shared bucket calculation function (medians are computed once for display and difference)
+        medians = calculate_bucket_medians(combined_scores, forward_returns)
+        
+        if medians is not None:
+            bottom_median, top_median = medians
+            difference = top_median - bottom_median
             
             period_display = format_forward_period_display(forward_period)
             print(f"{period_display:<20} {bottom_median:<30.2f}% {top_median:<30.2f}% {difference:<20.2f}% {len(combined_pairs):<15,}")
@@ -1196,6 +1553,11 @@ def main():
         nargs='?',
         help='Analysis mode: "average" for weighted average across all periods, "by-period" for per-period correlations, "buckets" for median return by metric buckets, "combine" for combining multiple metrics'
     )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Re-parse metrics.json instead of using the cached extracted columns'
+    )
     
     args = parser.parse_args()
     
@@ -1211,16 +1573,17 @@ def main():
     
     # Load data first to detect available metrics
     print("\nLoading data from metrics.json...")
-    data = load_data("metrics.json")
+    loaded = load_data("metrics.json", use_cache=not args.no_cache)
     
-    if not data:
+    if not loaded or loaded[0] == 0:
         print("No data loaded. Exiting.")
         return
     
-    print(f"Loaded data for {len(data)} stock(s)")
+    n_stocks, periods, columns = loaded
+    print(f"Loaded data for {n_stocks} stock(s)")
     
     # Detect available metrics
-    available_metrics = detect_available_metrics(data)
+    available_metrics = detect_available_metrics(columns)
     
     if not available_metrics:
         print("No metrics found in data. Exiting.")
@@ -1228,7 +1591,7 @@ def main():
     
     # Extract data once - this is now reused across all functions
     print("\nExtracting metrics and forward return data...")
-    metric_data = extract_unified_data(data, list(available_metrics.keys()))
+    metric_data = extract_unified_data(periods, columns, list(available_metrics.keys()))
     
     # Run the appropriate mode
     if mode == 'combine':
@@ -6,6 +6,7 @@ processed tickers to support resumable execution.
 """
 import json
 import os
+import random
 import threading
 import time
 from quickfs import QuickFS
@@ -13,9 +14,53 @@ from typing import Dict, List, Optional, Set, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from config import QUICKFS_API_KEY
 
+# orjson parses and serializes several times faster than the standard library; it is optional
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # QuickFS API Configuration
 API_KEY = QUICKFS_API_KEY
 
+# Number of tickers fetched concurrently
+MAX_WORKERS = 8
+
+# Number of fetched tickers written to the output file between flushes, and the output buffer size.
+# The buffer groups small records into large writes; full-history records can be hundreds of KB, so a
+# batch may exceed it, in which case the buffer simply writes out early (flushes still mark batch ends)
+WRITE_BATCH_SIZE = 16
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Directory for cached QuickFS responses, and how long a cached response is reused (24 hours)
+CACHE_DIR = ".qfs_cache"
+CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Retry backoff: delays double from the base delay on each attempt, are capped at RETRY_MAX_DELAY seconds,
+# and are jittered so that workers that failed together do not all retry at the same moment
+RATE_LIMIT_BASE_DELAY = 1.0
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+
+# HTTP client errors worth retrying (request timeout, rate limit); other 4xx responses fail the same way every time
+RETRYABLE_CLIENT_ERRORS = {408, 429}
+
+# QuickFS clients keep per-request state on the instance, so each thread gets its own client
+_thread_local = threading.local()
+
+def _get_client() -> QuickFS:
+    """
+    Get the calling thread's QuickFS client, creating it on first use
+    
+    Returns:
+        QuickFS client
+    """
+    client = getattr(_thread_local, "client", None)
+    if client is None:
+        client = QuickFS(API_KEY)
+        _thread_local.client = client
+    return client
+
 def load_tickers(filename: str = "tickers.json") -> List[str]:
     """
     Load ticker symbols from JSON file
@@ -24,12 +69,14 @@ def load_tickers(filename: str = "tickers.json") -> List[str]:
         filename: Path to JSON file containing tickers
     
     Returns:
-        List of ticker symbols
+        List of unique ticker symbols, in file order
     """
     try:
-        with open(filename, 'r') as f:
-            data = json.load(f)
-            return data.get("tickers", [])
+        with open(filename, 'rb') as f:
+            content = f.read()
+        data = orjson.loads(content) if orjson is not None else json.loads(content)
+        # A symbol listed twice would otherwise be fetched twice
+        return list(dict.fromkeys(data.get("tickers", [])))
     except FileNotFoundError:
         print(f"Error: {filename} not found")
         return []
@@ -37,19 +84,17 @@ def load_tickers(filename: str = "tickers.json") -> List[str]:
         print(f"Error: Invalid JSON in {filename}")
         return []
 
-def format_symbol(ticker: str) -> str:
+def has_quarterly_data(data: Optional[Dict]) -> bool:
     """
-    Format ticker symbol for QuickFS (add :US for US stocks)
+    Check whether a QuickFS response contains quarterly financials
     
     Args:
-        ticker: Ticker symbol
+        data: Full data response from QuickFS
     
     Returns:
-        Formatted ticker symbol
+        True if the response has a non-empty financials.quarterly section
     """
-    if ":" not in ticker:
-        return f"{ticker}:US"
-    return ticker
+    return bool(data) and "financials" in data and bool(data["financials"].get("quarterly"))
 
 def process_quarterly_data(data: Dict, symbol: str) -> Optional[Dict]:
     """
@@ -63,12 +108,9 @@ def process_quarterly_data(data: Dict, symbol: str) -> Optional[Dict]:
     Returns:
         Dictionary containing raw quarterly data in QuickFS format
     """
-    if not data or "financials" not in data:
-        return None
-    
-    quarterly = data["financials"].get("quarterly")
-    if not quarterly:
+    if not has_quarterly_data(data):
         return None
+    quarterly = data["financials"]["quarterly"]
     
     # Get company name from metadata
     metadata = data.get("metadata", {})
@@ -81,6 +123,71 @@ def process_quarterly_data(data: Dict, symbol: str) -> Optional[Dict]:
         "data": quarterly
     }
 
+def get_cache_path(formatted_symbol: str) -> str:
+    """
+    Get the path of the cached QuickFS response for a symbol
+    
+    Args:
+        formatted_symbol: Formatted ticker symbol (e.g., 'GOOGL:US')
+    
+    Returns:
+        Path of the cache file
+    """
+    return os.path.join(CACHE_DIR, formatted_symbol.replace(":", "_").replace(os.sep, "_") + ".json")
+
+def fetch_data_full(formatted_symbol: str) -> Optional[Dict]:
+    """
+    Fetch the full QuickFS data for a symbol, reusing a cached response younger than CACHE_TTL_SECONDS
+    
+    Args:
+        formatted_symbol: Formatted ticker symbol (e.g., 'GOOGL:US')
+    
+    Returns:
+        Full data response from QuickFS
+    """
+    cache_path = get_cache_path(formatted_symbol)
+    try:
+        if time.time() - os.path.getmtime(cache_path) < CACHE_TTL_SECONDS:
+            with open(cache_path, 'rb') as f:
+                cached = json.loads(f.read())
+            if has_quarterly_data(cached):
+                return cached
+    except (OSError, ValueError):
+        # No usable cached response; fetch from the API
+        pass
+    
+    data = _get_client().get_data_full(formatted_symbol)
+    
+    # Only cache responses with quarterly data, so an empty or malformed response is retried
+    # from the API on the next run instead of being replayed from the cache
+    if not has_quarterly_data(data):
+        return data
+    
+    # Cache the response, writing to a temp file first so readers never see a partial file
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        temp_path = cache_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(to_json_line(data))
+        os.replace(temp_path, cache_path)
+    except (OSError, TypeError) as e:
+        print(f"  Warning: Could not cache response for {formatted_symbol}: {e}")
+    
+    return data
+
+def get_retry_delay(attempt: int, base_delay: float) -> float:
+    """
+    Get the capped, jittered exponential backoff delay before a retry
+    
+    Args:
+        attempt: Zero-based number of the attempt that just failed
+        base_delay: Delay in seconds before jitter for the first retry
+    
+    Returns:
+        Delay in seconds, between 0.5x and 1.5x of min(RETRY_MAX_DELAY, base_delay * 2^attempt)
+    """
+    return min(RETRY_MAX_DELAY, base_delay * 2 ** attempt) * (0.5 + random.random())
+
 def fetch_single_ticker(ticker: str, max_retries: int = 3) -> Optional[Dict]:
     """
     Fetch data for a single ticker with rate limit handling
@@ -92,59 +199,68 @@ def fetch_single_ticker(ticker: str, max_retries: int = 3) -> Optional[Dict]:
     Returns:
         Dictionary containing quarterly data or None
     """
-    formatted_symbol = format_symbol(ticker)
+    # QuickFS needs an exchange suffix; tickers without one are US stocks
+    formatted_symbol = ticker if ":" in ticker else f"{ticker}:US"
     
     for attempt in range(max_retries):
         try:
-            client = QuickFS(API_KEY)
-            data = client.get_data_full(formatted_symbol)
+            data = fetch_data_full(formatted_symbol)
             processed_data = process_quarterly_data(data, ticker)
             return processed_data
         except Exception as e:
             error_str = str(e).lower()
+            # HTTP errors raised by QuickFS carry the response, and with it the status code
+            status_code = getattr(getattr(e, "response", None), "status_code", None)
             # Check for rate limit errors (429 or rate limit in message)
-            is_rate_limit = '429' in error_str or 'rate limit' in error_str or 'too many requests' in error_str
+            is_rate_limit = (status_code == 429 or '429' in error_str or 'rate limit' in error_str or
+                             'too many requests' in error_str)
             
-            if is_rate_limit and attempt < max_retries - 1:
-                # Exponential backoff for rate limits: 2^attempt seconds
-                wait_time = 2 ** attempt
-                print(f"  Rate limit hit for {ticker}, waiting {wait_time}s before retry {attempt + 1}/{max_retries}...")
+            if (status_code is not None and 400 <= status_code < 500 and
+                    status_code not in RETRYABLE_CLIENT_ERRORS):
+                # Client errors such as an unknown symbol or invalid API key will not succeed on retry
+                print(f"  Error fetching {ticker}: {e}")
+                return None
+            elif is_rate_limit and attempt < max_retries - 1:
+                # Exponential backoff with jitter for rate limits
+                wait_time = get_retry_delay(attempt, RATE_LIMIT_BASE_DELAY)
+                print(f"  Rate limit hit for {ticker}, waiting {wait_time:.1f}s before retry {attempt + 1}/{max_retries}...")
                 time.sleep(wait_time)
             elif attempt < max_retries - 1:
-                # Short delay for other errors
+                # Shorter exponential backoff with jitter for other errors
                 print(f"  Retry {attempt + 1}/{max_retries} for {ticker}...")
-                time.sleep(1)
+                time.sleep(get_retry_delay(attempt, RETRY_BASE_DELAY))
             else:
                 print(f"  Error fetching {ticker} after {max_retries} attempts: {e}")
                 return None
     
     return None
 
-def fetch_all_tickers_individual(tickers: List[str], max_workers: int = 25, 
+def fetch_all_tickers_individual(tickers: List[str], max_workers: int = MAX_WORKERS, 
                                   output_file: str = "data.jsonl") -> List[Optional[Dict]]:
     """
-    Fetch data for all tickers one at a time, sequentially (no threading)
-    Appends data to JSON file as each ticker is fetched
+    Fetch data for all tickers individually, using a thread pool to overlap requests
+    Appends data to JSON file as each ticker is fetched (from the calling thread only)
+    The output file is opened once for the whole run; remaining tickers are never already
+    in the file, so each result is a plain append with no scan or rewrite of existing lines
     
     Args:
         tickers: List of stock ticker symbols
-        max_workers: Ignored (kept for compatibility, but not used)
+        max_workers: Maximum number of concurrent requests
         output_file: Output JSON filename
     
     Returns:
-        List of dictionaries containing quarterly data for each ticker
+        List of dictionaries containing quarterly data for each ticker (in completion order)
     """
-    # Deduplicate input ticker list first (keep first occurrence)
-    seen_input = set()
-    unique_tickers = []
-    for ticker in tickers:
-        if ticker not in seen_input:
-            unique_tickers.append(ticker)
-            seen_input.add(ticker)
+    # Deduplicate input ticker list first (keep first occurrence; dicts preserve insertion order)
+    unique_tickers = list(dict.fromkeys(tickers))
     
     if len(unique_tickers) < len(tickers):
         print(f"Removed {len(tickers) - len(unique_tickers)} duplicate ticker(s) from input list")
     
+    if not unique_tickers:
+        print("No tickers to fetch")
+        return []
+    
     # Load existing data to skip already processed tickers
     existing_data, processed_tickers = load_existing_data(output_file)
     if processed_tickers:
@@ -157,35 +273,53 @@ def fetch_all_tickers_individual(tickers: List[str], max_workers: int = 25,
         skipped_count = len(unique_tickers) - len(remaining_tickers)
         print(f"Skipping {skipped_count} ticker(s) that are already in {output_file}")
     
-    total_tickers = len(unique_tickers)
-    print(f"Fetching data for {len(remaining_tickers)} ticker(s) sequentially (one at a time)...")
-    print(f"Data will be appended to {output_file} as fetched\n")
-    remaining_indices = [i for i, t in enumerate(tickers) if t not in processed_tickers]
-    
     if not remaining_tickers:
         print("All tickers already processed!")
         return []
     
+    total_tickers = len(unique_tickers)
+    print(f"Fetching data for {len(remaining_tickers)} ticker(s) with {max_workers} concurrent worker(s)...")
+    print(f"Data will be appended to {output_file} as fetched\n")
+    
     results = []
     completed = len(processed_tickers)
     
-    # Fetch one ticker at a time sequentially
-    for ticker in remaining_tickers:
+    # Fetch tickers concurrently; each result is saved as soon as its fetch completes
+    # Lines are buffered and flushed in batches; closing the file (also on an error or Ctrl+C) flushes the rest
+    unflushed = 0
+    with open(output_file, 'ab', buffering=WRITE_BUFFER_SIZE) as out_file, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_ticker = {executor.submit(fetch_single_ticker, ticker): ticker for ticker in remaining_tickers}
+        
+        for future in as_completed(future_to_ticker):
+            ticker = future_to_ticker[future]
+            try:
+                result = future.result()
+                results.append(result)
+                completed += 1
+                
+                if result:
+                    # Append to JSON file, flushing once per batch of tickers rather than after every line
+                    out_file.write(to_json_line(result))
+                    unflushed += 1
+                    if unflushed >= WRITE_BATCH_SIZE:
+                        out_file.flush()
+                        unflushed = 0
+                    print(f"  [{completed}/{total_tickers}] Fetched and saved {ticker}")
+                else:
+                    print(f"  [{completed}/{total_tickers}] Failed {ticker}")
+            except Exception as e:
+                print(f"  [{completed + 1}/{total_tickers}] Error processing {ticker}: {e}")
+                results.append(None)
+                completed += 1
+        
+        # Force the run's output to disk once at the end, rather than syncing after every line
+        # (fdatasync skips the metadata-only sync; it is not available on all systems, fsync is)
+        out_file.flush()
         try:
-            result = fetch_single_ticker(ticker)
-            results.append(result)
-            completed += 1
-            
-            if result:
-                # Append to JSON file immediately
-                append_stock_to_json(result, output_file, None)
-                print(f"  [{completed}/{total_tickers}] Fetched and saved {ticker}")
-            else:
-                print(f"  [{completed}/{total_tickers}] Failed {ticker}")
-        except Exception as e:
-            print(f"  [{completed + 1}/{total_tickers}] Error processing {ticker}: {e}")
-            results.append(None)
-            completed += 1
+            getattr(os, "fdatasync", os.fsync)(out_file.fileno())
+        except OSError as e:
+            print(f"Warning: Could not sync {output_file} to disk: {e}")
     
     return results
 
@@ -206,7 +340,6 @@ def load_existing_data(filename: str = "data.jsonl") -> Tuple[List[Dict], Set[st
     try:
         existing_data = []
         processed_tickers = set()
-        valid_lines = []
         
         with open(filename, 'r') as f:
             for line in f:
@@ -215,11 +348,9 @@ def load_existing_data(filename: str = "data.jsonl") -> Tuple[List[Dict], Set[st
                     continue
                 try:
                     stock = json.loads(line)
-                    symbol = stock.get("symbol")
-                    if symbol:
+                    if symbol := stock.get("symbol"):
                         processed_tickers.add(symbol)
                         existing_data.append(stock)
-                        valid_lines.append(line)
                 except json.JSONDecodeError:
                     # Skip invalid JSON lines (could be incomplete from interrupted write)
                     continue
@@ -236,144 +367,34 @@ def load_existing_data(filename: str = "data.jsonl") -> Tuple[List[Dict], Set[st
         print(f"Warning: Unexpected error reading {filename}: {e}")
         return [], set()
 
-def format_stock_data_for_json(stock_data: Dict) -> Dict:
+def to_json_line(data: Dict) -> bytes:
     """
-    Format a single stock's data for JSON output (raw data in QuickFS format)
+    Serialize a dictionary as one compact JSONL line
     
     Args:
-        stock_data: Dictionary containing quarterly data for a stock
+        data: Dictionary to serialize
     
     Returns:
-        Formatted dictionary for JSON output with all raw data in compact format
+        UTF-8 encoded JSON followed by a newline
     """
-    output_stock = {
-        "symbol": stock_data.get("symbol"),
-        "company_name": stock_data.get("company_name"),
-        "data": stock_data.get("data", {})  # Store in QuickFS format: metric -> list of values
-    }
-    
-    return output_stock
-
-def append_stock_to_json(stock_data: Dict, filename: str = "data.jsonl", file_lock: threading.Lock = None):
-    """
-    Append a single stock's data to JSONL file (one JSON object per line)
-    If ticker already exists, replaces it by rewriting the file atomically
-    For new tickers, efficiently appends to end of file
-    Uses atomic writes to prevent corruption if interrupted
-    
-    Args:
-        stock_data: Dictionary containing quarterly data for a stock
-        filename: Output filename
-        file_lock: Thread lock for file operations (optional)
-    """
-    if not stock_data:
-        return
-    
-    try:
-        # Use lock if provided (for thread safety)
-        if file_lock:
-            file_lock.acquire()
-        
-        try:
-            symbol = stock_data.get("symbol")
-            formatted_data = format_stock_data_for_json(stock_data)
-            new_line = json.dumps(formatted_data, separators=(',', ':'))
-            
-            # Quick check if ticker exists (only read first part of file if needed)
-            ticker_found = False
-            if os.path.exists(filename):
-                # Check if ticker exists by scanning file
-                with open(filename, 'r') as f:
-                    for line in f:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        try:
-                            stock = json.loads(line)
-                            if stock.get("symbol") == symbol:
-                                ticker_found = True
-                                break
-                        except json.JSONDecodeError:
-                            continue
-            
-            if ticker_found:
-                # Ticker exists - need to rewrite file to replace it
-                # Use atomic write: write to temp file, then rename
-                existing_lines = []
-                if os.path.exists(filename):
-                    with open(filename, 'r') as f:
-                        for line in f:
-                            line = line.strip()
-                            if not line:
-                                continue
-                            try:
-                                stock = json.loads(line)
-                                if stock.get("symbol") == symbol:
-                                    # Replace with new data
-                                    existing_lines.append(new_line)
-                                else:
-                                    existing_lines.append(line)
-                            except json.JSONDecodeError:
-                                # Skip invalid JSON lines to keep file clean
-                                continue
-                
-                # Atomic write: write to temp file first, then rename
-                temp_filename = filename + '.tmp'
-                try:
-                    with open(temp_filename, 'w') as f:
-                        for line in existing_lines:
-                            f.write(line + '\n')
-                    # Only rename if write was successful
-                    # On Windows, we need to remove the old file first if it exists
-                    if os.path.exists(filename):
-                        os.replace(temp_filename, filename)
-                    else:
-                        os.rename(temp_filename, filename)
-                except Exception as e:
-                    # If something went wrong, try to clean up temp file
-                    if os.path.exists(temp_filename):
-                        try:
-                            os.remove(temp_filename)
-                        except:
-                            pass
-                    raise e
-            else:
-                # Ticker doesn't exist - append new line
-                # For JSONL format, appending is safe because each line is independent
-                # If interrupted, only the last line might be incomplete, which we handle when reading
-                try:
-                    with open(filename, 'a') as f:
-                        f.write(new_line + '\n')
-                        f.flush()  # Ensure data is written to disk
-                        os.fsync(f.fileno())  # Force write to disk (if available)
-                except (AttributeError, OSError):
-                    # os.fsync might not be available on all systems, that's okay
-                    # The flush() is usually sufficient
-                    with open(filename, 'a') as f:
-                        f.write(new_line + '\n')
-                        f.flush()
-        finally:
-            if file_lock:
-                file_lock.release()
-                
-    except Exception as e:
-        print(f"  Error appending {stock_data.get('symbol', 'unknown')} to {filename}: {e}")
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(data, separators=(',', ':')) + '\n').encode('utf-8')
 
 def save_to_json(all_data: List[Dict], filename: str = "data.jsonl"):
     """
     Save all quarterly data to JSONL file (one JSON object per line)
     
     Args:
-        all_data: List of dictionaries containing quarterly data for all stocks
+        all_data: List of dictionaries containing quarterly data for all stocks (as returned by process_quarterly_data)
         filename: Output filename
     """
     try:
         # Write each stock as a separate line in JSONL format
-        with open(filename, 'w') as f:
+        with open(filename, 'wb') as f:
             for stock_data in all_data:
                 if stock_data:  # Only include valid data
-                    formatted_data = format_stock_data_for_json(stock_data)
-                    f.write(json.dumps(formatted_data, separators=(',', ':')) + '\n')
+                    f.write(to_json_line(stock_data))
         
         count = sum(1 for stock_data in all_data if stock_data)
         print(f"\nFinal data saved to {filename}")
@@ -398,8 +419,7 @@ def main():
     print(f"\nFound {len(tickers)} ticker(s)\n")
     
     # Fetch data for all tickers individually (data is appended as fetched)
-    # Fetching sequentially (one at a time) to measure baseline speed
-    all_results = fetch_all_tickers_individual(tickers, max_workers=1, output_file="data.jsonl")
+    all_results = fetch_all_tickers_individual(tickers, max_workers=MAX_WORKERS, output_file="data.jsonl")
     
     # Filter out None results for summary
     all_data = [stock_data for stock_data in all_results if stock_data]
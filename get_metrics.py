@@ -13,61 +13,346 @@ Enterprise Value = Market Cap + Total Debt - Cash and Cash Equivalents
 Relative PS = Current Price-to-Sales / 5-Year Average Price-to-Sales (20 quarters)
 """
 import json
+import mmap
 import os
-from typing import Dict, List, Optional
+import pickle
+from collections import deque
+from itertools import chain, islice
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
 
-def load_data_from_jsonl(filename: str = "data.jsonl") -> List[Dict]:
+# orjson parses and serializes several times faster than the standard library; it is optional
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Stocks are split into about this many tasks per worker process; batching stocks into tasks amortizes
+# the pickling and inter-process round trip of each task, while several tasks per worker still balance
+# the load when some stocks have much more history than others
+TASKS_PER_WORKER = 4
+
+# Stocks per worker task when the stocks arrive as a stream and their number is not known up front
+STREAM_CHUNKSIZE = 16
+
+# Tasks submitted to each worker process ahead of the results being consumed; keeps the workers busy
+# while bounding how many stocks are held in memory when stocks arrive as a stream
+MAX_PENDING_TASKS_PER_WORKER = 2
+
+# Keys of each quarterly entry in metrics.json, in output order:
+#   forward_return: annualized return from period j+1 to the most recent period
+#   forward_return_1y/3y/5y/10y: annualized 1, 3, 5 and 10-year forward returns
+#   ebit_ppe: operating income / PPE (quarterly); ebit_ppe_ttm: TTM operating income / TTM PPE (4 trailing quarters)
+#   gross_margin: (revenue - COGS) / revenue; operating_margin: operating income / revenue
+#   ev_ebit: enterprise value / EBIT (operating income)
+#   relative_ps: current price-to-sales / 5-year average price-to-sales
+OUTPUT_KEYS = ("period", "total_return", "forward_return", "forward_return_1y", "forward_return_3y",
+               "forward_return_5y", "forward_return_10y", "roa", "ebit_ppe", "ebit_ppe_ttm", "gross_margin",
+               "operating_margin", "ev_ebit", "relative_ps")
+
+# Annualized forward return windows: output key and the number of future quarters each one compounds
+# (1y=4, 3y=12, 5y=20, 10y=40)
+FORWARD_RETURN_WINDOWS = (("forward_return_1y", 4), ("forward_return_3y", 12),
+                          ("forward_return_5y", 20), ("forward_return_10y", 40))
+
+# Metrics whose data completeness (number of quarters with a value) is reported in the summary
+DATA_POINT_METRICS = ("roa", "ebit_ppe", "ebit_ppe_ttm", "gross_margin", "operating_margin", "ev_ebit", "relative_ps",
+                      "forward_return_1y", "forward_return_3y", "forward_return_5y", "forward_return_10y")
+
+# Below this many stocks, starting worker processes costs more than it saves, so stocks are processed serially
+PARALLEL_MIN_STOCKS = 100
+
+def to_float_array(values: List, length: int) -> np.ndarray:
     """
-    Load stock data from JSONL file (one JSON object per line)
+    Convert a list of values to a float array of the given length
+    
+    Args:
+        values: List of numbers, with None for missing values (may be shorter or longer than length)
+        length: Length of the resulting array
+    
+    Returns:
+        Float64 array with NaN for missing values and for positions past the end of values
+    """
+    # Pad with NaN (or truncate) to the period count once, so no metric needs per-period length checks;
+    # numpy converts None to NaN when assigning into a float array, so no per-value check is needed either
+    array = np.full(length, np.nan)
+    count = min(len(values), length)
+    array[:count] = values[:count]
+    return array
+
+def to_optional_list(array: np.ndarray) -> List[Optional[float]]:
+    """
+    Convert a float array to a list of floats, with None for NaN
+    
+    Args:
+        array: Float array
+    
+    Returns:
+        List of floats, with None where the array is NaN
+    """
+    return [None if v != v else v for v in array.tolist()]
+
+def get_cache_filename(filename: str) -> str:
+    """
+    Get the path of the parsed-data cache for a JSONL file
     
     Args:
         filename: Path to JSONL file
     
     Returns:
-        List of dictionaries containing stock data
+        Path of the .pkl cache stored next to the JSONL file
     """
-    if not os.path.exists(filename):
-        print(f"Error: {filename} not found")
-        return []
+    return filename + ".stream.cache.pkl"
+
+def get_source_signature(filename: str) -> tuple:
+    """
+    Get the modification time and size of a file, used to check that a cache was built from it
+    
+    Args:
+        filename: Path to the file
+    
+    Returns:
+        Tuple of (st_mtime_ns, st_size)
+    """
+    st = os.stat(filename)
+    return st.st_mtime_ns, st.st_size
+
+def open_cached_stocks(filename: str):
+    """
+    Open the parsed-data cache for reading if it was built from the current JSONL file
+    
+    The cache starts with the modification time and size of the JSONL file it was built from, and
+    is only used when both still match exactly (a newer cache is not enough: an older data.jsonl
+    restored with its modification time preserved would otherwise reuse stale data).
+    
+    Args:
+        filename: Path to JSONL file the cache was built from
     
-    stocks = []
+    Returns:
+        Cache file opened in binary mode and positioned at the first stock, or None if there is
+        no usable cache
+    """
+    cache_filename = get_cache_filename(filename)
     try:
-        with open(filename, 'r') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if not line:  # Skip empty lines
-                    continue
-                try:
-                    stock = json.loads(line)
-                    stocks.append(stock)
-                except json.JSONDecodeError as e:
-                    print(f"Warning: Skipping invalid JSON on line {line_num}: {e}")
-                    continue
-    except Exception as e:
-        print(f"Error reading {filename}: {e}")
-        return []
+        cache_file = open(cache_filename, 'rb')
+    except OSError:
+        return None
+    try:
+        if pickle.load(cache_file) == get_source_signature(filename):
+            return cache_file
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+    cache_file.close()
+    return None
+
+def iter_cached_stocks(cache_file) -> Iterator[Dict]:
+    """
+    Yield stock data from the parsed-data cache, one pickle record per stock
+    
+    Args:
+        cache_file: Cache file from open_cached_stocks (closed once the iterator is exhausted)
+    
+    Returns:
+        Iterator over dictionaries containing stock data, in file order
+    """
+    with cache_file:
+        while True:
+            try:
+                stock = pickle.load(cache_file)
+            except EOFError:
+                return
+            yield stock
+
+def cache_stocks(filename: str, stocks: Iterable[Dict]) -> Iterator[Dict]:
+    """
+    Pass stocks through, writing each one to the parsed-data cache as a separate pickle record
+    
+    Stocks are written as they pass, so the cache never needs all of them in memory at once. The
+    cache is written to a temporary file and only replaces the old cache once every stock has
+    passed through, so a partly consumed stream never leaves a truncated cache behind.
+    
+    Args:
+        filename: Path to JSONL file the stocks were parsed from
+        stocks: Dictionaries containing stock data
+    
+    Returns:
+        Iterator over the same stocks, in order
+    """
+    cache_filename = get_cache_filename(filename)
+    temp_filename = cache_filename + ".tmp"
+    cache_file = None
+    try:
+        # The cache is tied to the JSONL file as it is before parsing starts
+        source_signature = get_source_signature(filename)
+        cache_file = open(temp_filename, 'wb')
+        pickle.dump(source_signature, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        print(f"Warning: Could not write cache {cache_filename}: {e}")
+        if cache_file is not None:
+            cache_file.close()
+            os.remove(temp_filename)
+        yield from stocks
+        return
     
-    return stocks
+    cache_ok = True
+    try:
+        with cache_file:
+            for stock in stocks:
+                if cache_ok:
+                    try:
+                        pickle.dump(stock, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+                    except OSError as e:
+                        print(f"Warning: Could not write cache {cache_filename}: {e}")
+                        cache_ok = False
+                yield stock
+        if cache_ok:
+            os.replace(temp_filename, cache_filename)
+    except OSError as e:
+        print(f"Warning: Could not write cache {cache_filename}: {e}")
+    finally:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
 
-def extract_quarterly_data(stock_data: Dict) -> Optional[Dict]:
+def iter_data_from_jsonl(filename: str = "data.jsonl", use_cache: bool = True) -> Iterator[Dict]:
     """
-    Extract and process quarterly data from stock data dictionary
+    Yield stock data from JSONL file (one JSON object per line) as each line is parsed
+    
+    Consumers can start working on the first stocks while the rest of the file is still being
+    parsed, and only the stocks not yet consumed are held in memory. The parsed data is cached
+    in a pickle file next to the JSONL file (one record per stock, written as stocks are parsed),
+    and replayed one stock at a time as long as the JSONL file has not been modified since,
+    which skips JSON parsing entirely.
     
     Args:
-        stock_data: Dictionary containing stock data from data.jsonl
+        filename: Path to JSONL file
+        use_cache: Whether to read and write the parsed-data cache
     
     Returns:
-        Dictionary containing processed quarterly data with total_return, forward_return (total to end, annualized), 
-        forward returns (1y, 3y, 5y, 10y, all annualized), ROA, EBIT/PPE, EBIT/PPE TTM, Gross Margin, Operating Margin, EV/EBIT, and Relative PS
+        Iterator over dictionaries containing stock data, in file order
+    """
+    if use_cache:
+        cache_file = open_cached_stocks(filename)
+        if cache_file is not None:
+            yield from iter_cached_stocks(cache_file)
+        else:
+            yield from cache_stocks(filename, iter_data_from_jsonl(filename, use_cache=False))
+        return
+    
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:  # An empty file cannot be memory-mapped
+            return
+        
+        # Map the file and hand each line to the parser as a slice of the mapping; orjson parses a
+        # memoryview in place, so lines are never copied into separate bytes objects first
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm) if orjson is not None else mm
+            loads = orjson.loads if orjson is not None else json.loads
+            try:
+                size = len(mm)
+                start = 0
+                line_num = 0
+                while start < size:
+                    # Parse lines in a tight loop and only leave it for an invalid line, so clean files
+                    # never pay for per-line error handling; parsing resumes after the invalid line
+                    try:
+                        while start < size:
+                            line_start = start
+                            end = mm.find(b'\n', start)
+                            if end == -1:
+                                end = size
+                            line_num += 1
+                            start = end + 1
+                            yield loads(view[line_start:end])
+                    except json.JSONDecodeError as e:
+                        if mm[line_start:end].strip():  # Skip empty lines silently
+                            print(f"Warning: Skipping invalid JSON on line {line_num}: {e}")
+            finally:
+                if orjson is not None:
+                    view.release()
+
+def compute_returns(prices: np.ndarray, dividends: np.ndarray) -> tuple:
+    """
+    Calculate the quarterly total return and the annualized total forward return of each period
+    
+    Args:
+        prices: Period end prices, with 0.0 for missing prices
+        dividends: Dividends paid in each period (same length as prices), with 0.0 for missing dividends
+    
+    Returns:
+        Tuple of (total_returns, forward_returns) float64 arrays (as fractions, e.g. 0.05 for 5%),
+        with NaN where a return cannot be calculated
+        total_return = (Ending Price - Beginning Price + Dividends) / Beginning Price
         forward_return = Annualized return from period j+1 to most recent period
-        Forward returns 1y/3y/5y/10y are annualized returns for 1 year (4 quarters), 3 years (12 quarters), 5 years (20 quarters), and 10 years (40 quarters)
-        EBIT/PPE = Operating Income / PPE (quarterly)
-        EBIT/PPE TTM = Sum of Operating Income from quarters t, t-1, t-2, t-3 / Sum of PPE from quarters t, t-1, t-2, t-3
-        Gross Margin = (Revenue - Cost of Goods Sold) / Revenue
-        Operating Margin = Operating Income / Revenue
-        EV/EBIT = Enterprise Value / EBIT (Operating Income)
-        Enterprise Value = Market Cap + Total Debt - Cash and Cash Equivalents
-        Relative PS = Current Price-to-Sales / 5-Year Average Price-to-Sales (20 quarters)
+    """
+    num_periods = len(prices)
+    
+    # Calculate total return for each quarter (compared to previous quarter)
+    # A quarter needs positive prices at both ends, otherwise it has no total return
+    prev_prices = prices[:-1]
+    current_prices = prices[1:]
+    total_returns = np.full(num_periods, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total_returns[1:] = np.where((prev_prices > 0) & (current_prices > 0),
+                                     (current_prices - prev_prices + dividends[1:]) / prev_prices,
+                                     np.nan)
+    
+    # Calculate total forward return (from period j+1 to most recent period, annualized)
+    # Returns are compounded in log space: a reverse cumulative sum of log(1 + return) gives the log of the
+    # compounded growth from each period to the most recent one; a missing return (NaN) propagates to every
+    # earlier period, which then has no forward return
+    forward_returns = np.full(num_periods, np.nan)
+    if num_periods > 1:
+        # A -100% return has log(0) = -inf, which compounds to a -100% forward return as intended
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_growth_to_end = np.cumsum(np.log1p(total_returns[1:])[::-1])[::-1]
+            # Annualize the compounded growth, where years = number of future quarters / 4:
+            # growth^(1/years) - 1 = expm1(log(growth) / years), which stays precise for small returns
+            years = np.arange(num_periods - 1, 0, -1) / 4.0
+            forward_returns[:-1] = np.expm1(log_growth_to_end / years)
+    
+    return total_returns, forward_returns
+
+def compute_window_returns(total_returns: np.ndarray, required_quarters: int) -> np.ndarray:
+    """
+    Calculate the annualized forward return over a fixed number of future quarters for each period
+    
+    Args:
+        total_returns: Quarterly total returns (as fractions), with NaN for missing returns
+        required_quarters: Number of future quarters to compound (e.g., 4 for 1 year)
+    
+    Returns:
+        Float64 array of annualized forward returns (as percentages) from period j+1 to j+required_quarters,
+        with NaN where fewer than required_quarters future periods exist or any of their returns is missing
+    """
+    num_periods = len(total_returns)
+    window_returns = np.full(num_periods, np.nan)
+    
+    # Need j+1 to j+required_quarters, so only periods j < num_periods - required_quarters have a window
+    if num_periods > required_quarters:
+        # Compound every window of future quarters at once in log space (sum of log(1 + return));
+        # a missing return (NaN) makes the window NaN, and a -100% return (log of 0) makes it -100%
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_growth = sliding_window_view(np.log1p(total_returns[1:]), required_quarters).sum(axis=1)
+            # Annualize, where years = required_quarters / 4, as expm1(log(growth) / years)
+            window_returns[:num_periods - required_quarters] = np.expm1(log_growth * (4.0 / required_quarters)) * 100.0
+    
+    return window_returns
+
+def compute_metric_columns(stock_data: Dict) -> Optional[tuple]:
+    """
+    Calculate every metric of a stock for all of its quarters at once
+    
+    Args:
+        stock_data: Dictionary containing stock data from data.jsonl
+    
+    Returns:
+        Tuple of (symbol, company_name, period_dates, columns), where columns maps each metric
+        (total_return, forward_return, forward_return_1y/3y/5y/10y, roa, ebit_ppe, ebit_ppe_ttm,
+        gross_margin, operating_margin, ev_ebit, relative_ps) to a float64 array with one value per
+        period and NaN where the metric cannot be calculated; None if the stock has no usable data
+        (the metric definitions are in the module docstring)
     """
     if not stock_data or "data" not in stock_data:
         return None
@@ -125,213 +410,98 @@ def extract_quarterly_data(stock_data: Dict) -> Optional[Dict]:
     if not isinstance(price_to_sales, list):
         price_to_sales = []
     
-    # Process the data into quarterly entries
-    quarterly_data = []
-    for j in range(len(period_dates)):
-        current_price = prices[j] if j < len(prices) and prices[j] is not None else 0.0
-        current_dividend = dividends[j] if j < len(dividends) and dividends[j] is not None else 0.0
-        current_roa = roa[j] if j < len(roa) and roa[j] is not None else None
-        
-        # Calculate operating income / PPE (EBIT/PPE metric)
-        ebit_ppe = None
-        if (j < len(operating_income) and j < len(ppe_net) and 
-            operating_income[j] is not None and ppe_net[j] is not None and 
-            ppe_net[j] != 0):
-            ebit_ppe = operating_income[j] / ppe_net[j]
-        
-        # Calculate gross margin = (Revenue - Cost of Goods Sold) / Revenue
-        gross_margin = None
-        if (j < len(revenue) and j < len(cost_of_goods_sold) and
-            revenue[j] is not None and cost_of_goods_sold[j] is not None and
-            revenue[j] != 0):
-            gross_margin = (revenue[j] - cost_of_goods_sold[j]) / revenue[j]
-        
-        # Calculate operating margin = Operating Income / Revenue
-        operating_margin = None
-        if (j < len(operating_income) and j < len(revenue) and
-            operating_income[j] is not None and revenue[j] is not None and
-            revenue[j] != 0):
-            operating_margin = operating_income[j] / revenue[j]
-        
-        # Calculate EV/EBIT = Enterprise Value / EBIT (Operating Income)
-        # Enterprise Value is already calculated in the data
-        ev_ebit = None
-        if (j < len(enterprise_value) and j < len(operating_income) and
-            enterprise_value[j] is not None and operating_income[j] is not None and
-            operating_income[j] != 0):
-            # Calculate EV/EBIT ratio
-            # Note: enterprise_value can be negative, but we'll still calculate the ratio
-            ev_ebit = enterprise_value[j] / operating_income[j]
-        
-        # Calculate total return for the quarter (compared to previous quarter)
-        # Formula: Total Return = ((Ending Price - Beginning Price + Dividends) / Beginning Price) * 100
-        total_return = None
-        if j > 0 and j - 1 < len(prices):
-            prev_price = prices[j-1] if prices[j-1] is not None else 0.0
-            if prev_price > 0 and current_price > 0:
-                total_return = ((current_price - prev_price + current_dividend) / prev_price) * 100
-        
-        quarterly_data.append({
-            "period": period_dates[j],
-            "price": current_price,
-            "dividends": current_dividend,
-            "roa": current_roa,
-            "ebit_ppe": ebit_ppe,  # Operating income / PPE
-            "gross_margin": gross_margin,  # (Revenue - COGS) / Revenue
-            "operating_margin": operating_margin,  # Operating Income / Revenue
-            "ev_ebit": ev_ebit,  # Enterprise Value / EBIT (Operating Income)
-            "total_return": total_return
-        })
-    
-    # Calculate forward returns for specific periods: 1y, 3y, 5y, 10y
-    # Each period requires a specific number of quarters: 1y=4, 3y=12, 5y=20, 10y=40
-    forward_return_periods = {
-        '1y': 4,
-        '3y': 12,
-        '5y': 20,
-        '10y': 40
-    }
+    num_periods = len(period_dates)
     
-    for j in range(len(quarterly_data)):
-        # Initialize all forward returns to None
-        for period_name in forward_return_periods.keys():
-            quarterly_data[j][f"forward_return_{period_name}"] = None
-        
-        # Calculate forward return for each period
-        for period_name, required_quarters in forward_return_periods.items():
-            # Check if we have enough future periods (need j+1 to j+required_quarters, so j+required_quarters < len)
-            if j + required_quarters < len(quarterly_data):
-                # Start with 100% and compound each future period's return
-                cumulative_value = 100.0
-                valid_returns = True
-                
-                # Compound returns from period j+1 to j+required_quarters (inclusive)
-                for k in range(j + 1, j + required_quarters + 1):
-                    if k >= len(quarterly_data):
-                        valid_returns = False
-                        break
-                    period_return = quarterly_data[k].get("total_return")
-                    if period_return is not None and isinstance(period_return, (int, float)):
-                        # Compound: multiply by (1 + return/100)
-                        cumulative_value = cumulative_value * (1 + float(period_return) / 100.0)
-                    else:
-                        # If any return is missing, we can't calculate forward return
-                        valid_returns = False
-                        break
-                
-                if valid_returns:
-                    # Calculate cumulative return: (final_value - 100)
-                    cumulative_return = (cumulative_value - 100.0)
-                    
-                    # Annualize the return
-                    # Formula: annualized_return = ((1 + cumulative_return/100)^(1/years) - 1) * 100
-                    # Where years = required_quarters / 4
-                    years = required_quarters / 4.0
-                    if years > 0:
-                        # Convert cumulative return to decimal (e.g., 50% -> 0.50)
-                        cumulative_return_decimal = cumulative_return / 100.0
-                        # Annualize: (1 + cumulative_return)^(1/years) - 1
-                        annualized_return_decimal = (1 + cumulative_return_decimal) ** (1.0 / years) - 1.0
-                        # Convert back to percentage
-                        forward_return = annualized_return_decimal * 100.0
-                        quarterly_data[j][f"forward_return_{period_name}"] = forward_return
-        
-        # Calculate total forward return (from period j+1 to most recent period, annualized)
-        total_forward_return = None
-        if j < len(quarterly_data) - 1:
-            # Start with 100% and compound each future period's return
-            cumulative_value = 100.0
-            valid_returns = True
-            num_quarters = 0
-            
-            # Compound returns from period j+1 to the most recent period
-            for k in range(j + 1, len(quarterly_data)):
-                period_return = quarterly_data[k].get("total_return")
-                if period_return is not None and isinstance(period_return, (int, float)):
-                    # Compound: multiply by (1 + return/100)
-                    cumulative_value = cumulative_value * (1 + float(period_return) / 100.0)
-                    num_quarters += 1
-                else:
-                    # If any return is missing, we can't calculate forward return
-                    valid_returns = False
-                    break
-            
-            if valid_returns and num_quarters > 0:
-                # Calculate cumulative return: (final_value - 100)
-                cumulative_return = (cumulative_value - 100.0)
-                
-                # Annualize the return
-                # Formula: annualized_return = ((1 + cumulative_return/100)^(1/years) - 1) * 100
-                # Where years = num_quarters / 4
-                years = num_quarters / 4.0
-                if years > 0:
-                    # Convert cumulative return to decimal (e.g., 50% -> 0.50)
-                    cumulative_return_decimal = cumulative_return / 100.0
-                    # Annualize: (1 + cumulative_return)^(1/years) - 1
-                    annualized_return_decimal = (1 + cumulative_return_decimal) ** (1.0 / years) - 1.0
-                    # Convert back to percentage
-                    total_forward_return = annualized_return_decimal * 100.0
-        
-        quarterly_data[j]["forward_return"] = total_forward_return
+    # Calculate total return and total forward return for every quarter at once
+    price_array = np.nan_to_num(to_float_array(prices, num_periods), nan=0.0)
+    dividend_array = np.nan_to_num(to_float_array(dividends, num_periods), nan=0.0)
+    total_returns, forward_returns = compute_returns(price_array, dividend_array)
     
-    # Calculate TTM (Trailing Twelve Months) EBIT/PPE
-    # TTM EBIT/PPE = Sum of operating income from quarters t, t-1, t-2, t-3 / Sum of PPE from quarters t, t-1, t-2, t-3
-    for j in range(len(quarterly_data)):
-        ebit_ppe_ttm = None
+    # Returns are carried as fractions and only converted to percentages for output
+    columns = {
+        "total_return": total_returns * 100.0,
+        "forward_return": forward_returns * 100.0,  # Annualized return from period j+1 to most recent period
+        "roa": to_float_array(roa, num_periods)
+    }
+    # Calculate forward returns for specific periods: 1y, 3y, 5y, 10y
+    for key, required_quarters in FORWARD_RETURN_WINDOWS:
+        columns[key] = compute_window_returns(total_returns, required_quarters)
+    
+    # Calculate the ratio metrics for every quarter at once
+    # Missing values are NaN, which propagates through the arithmetic, so any quarter missing an input
+    # (or with a zero denominator) has no value for that metric
+    operating_income_array = to_float_array(operating_income, num_periods)
+    ppe_array = to_float_array(ppe_net, num_periods)
+    revenue_array = to_float_array(revenue, num_periods)
+    cost_of_goods_sold_array = to_float_array(cost_of_goods_sold, num_periods)
+    enterprise_value_array = to_float_array(enterprise_value, num_periods)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # EBIT/PPE = Operating Income / PPE
+        columns["ebit_ppe"] = np.where(ppe_array != 0, operating_income_array / ppe_array, np.nan)
         
-        # Need at least 4 quarters of data (j >= 3) to calculate TTM
-        if j >= 3:
-            # Sum operating income from quarters j, j-1, j-2, j-3
-            ttm_operating_income = 0.0
-            ttm_ppe = 0.0
-            valid_data = True
-            
-            # Sum the 4 trailing quarters (t, t-1, t-2, t-3)
-            for k in range(j - 3, j + 1):
-                if k < len(operating_income) and k < len(ppe_net):
-                    oi = operating_income[k] if k < len(operating_income) else None
-                    ppe = ppe_net[k] if k < len(ppe_net) else None
-                    
-                    if oi is not None and ppe is not None:
-                        ttm_operating_income += float(oi)
-                        ttm_ppe += float(ppe)
-                    else:
-                        valid_data = False
-                        break
-                else:
-                    valid_data = False
-                    break
-            
-            # Calculate TTM EBIT/PPE if we have valid data and PPE is not zero
-            if valid_data and ttm_ppe != 0:
-                ebit_ppe_ttm = ttm_operating_income / ttm_ppe
+        # Calculate TTM (Trailing Twelve Months) EBIT/PPE
+        # TTM EBIT/PPE = Sum of operating income from quarters t, t-1, t-2, t-3 / Sum of PPE from quarters t, t-1, t-2, t-3
+        # Each window of 4 quarters is summed at once; a missing quarter makes its window's sum NaN,
+        # and the first 3 quarters (fewer than 4 quarters of data) have no TTM value
+        ebit_ppe_ttm = np.full(num_periods, np.nan)
+        if num_periods >= 4:
+            ttm_operating_income = sliding_window_view(operating_income_array, 4).sum(axis=1)
+            ttm_ppe = sliding_window_view(ppe_array, 4).sum(axis=1)
+            ebit_ppe_ttm[3:] = np.where(ttm_ppe != 0, ttm_operating_income / ttm_ppe, np.nan)
+        columns["ebit_ppe_ttm"] = ebit_ppe_ttm
         
-        quarterly_data[j]["ebit_ppe_ttm"] = ebit_ppe_ttm
+        # Gross margin = (Revenue - Cost of Goods Sold) / Revenue
+        columns["gross_margin"] = np.where(revenue_array != 0,
+                                           (revenue_array - cost_of_goods_sold_array) / revenue_array, np.nan)
+        # Operating margin = Operating Income / Revenue
+        columns["operating_margin"] = np.where(revenue_array != 0, operating_income_array / revenue_array, np.nan)
+        # EV/EBIT = Enterprise Value / EBIT (Operating Income); Enterprise Value is already calculated in the data
+        # Note: enterprise_value can be negative, but we'll still calculate the ratio
+        columns["ev_ebit"] = np.where(operating_income_array != 0,
+                                      enterprise_value_array / operating_income_array, np.nan)
     
     # Calculate Relative PS (Price-to-Sales)
     # Relative PS = Current Price-to-Sales / 5-Year Average Price-to-Sales
     # 5 years = 20 quarters
-    for j in range(len(quarterly_data)):
-        relative_ps = None
-        current_ps = price_to_sales[j] if j < len(price_to_sales) and price_to_sales[j] is not None else None
-        
-        # Need at least 20 quarters of data (j >= 19) to calculate 5-year average
-        if j >= 19 and current_ps is not None and current_ps > 0:
-            # Calculate 5-year average (20 quarters) of price_to_sales
-            ps_values = []
-            for k in range(j - 19, j + 1):  # Include current period in average
-                if k < len(price_to_sales) and price_to_sales[k] is not None:
-                    ps_val = price_to_sales[k]
-                    if ps_val is not None and ps_val > 0:  # Only include positive values
-                        ps_values.append(float(ps_val))
-            
-            if len(ps_values) > 0:
-                # Calculate average
-                avg_ps_5yr = sum(ps_values) / len(ps_values)
-                if avg_ps_5yr > 0:
-                    relative_ps = current_ps / avg_ps_5yr
-        
-        quarterly_data[j]["relative_ps"] = relative_ps
+    # Only positive values count, so mark them once up front (missing values are NaN, which is not positive)
+    ps_array = to_float_array(price_to_sales, num_periods)
+    ps_positive = ps_array > 0
+    relative_ps = np.full(num_periods, np.nan)
+    
+    # Need at least 20 quarters of data (j >= 19) to calculate 5-year average; earlier entries stay NaN
+    if num_periods >= 20:
+        # Sum and count the positive price_to_sales values of every 20-quarter window (including the current
+        # period) at once
+        ps_window_sums = sliding_window_view(np.where(ps_positive, ps_array, 0.0), 20).sum(axis=1)
+        ps_window_counts = sliding_window_view(ps_positive, 20).sum(axis=1)
+        # Only periods with a positive current value get a Relative PS; the current period is then always
+        # included, so the average is positive
+        current_positive = ps_positive[19:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_ps_5yr = ps_window_sums / ps_window_counts
+            relative_ps[19:] = np.where(current_positive, ps_array[19:] / avg_ps_5yr, np.nan)
+    columns["relative_ps"] = relative_ps
+    
+    return symbol, company_name, period_dates, columns
+
+def build_metrics_entry(symbol: str, company_name: str, period_dates: List, columns: Dict[str, np.ndarray]) -> Dict:
+    """
+    Build a stock's metrics.json entry from its metric columns
+    
+    Args:
+        symbol: Stock symbol
+        company_name: Company name
+        period_dates: Period of each quarter
+        columns: Mapping of metric -> float array, as returned by compute_metric_columns
+    
+    Returns:
+        Dictionary with symbol, company_name, and one entry per quarter holding every metric
+        (None where a metric cannot be calculated)
+    """
+    # Convert each column to a plain list once, then zip the columns into rows; entries are built
+    # directly in the metrics.json output shape and key order, so saving needs no second copy
+    metric_lists = [to_optional_list(columns[key]) for key in OUTPUT_KEYS[1:]]
+    quarterly_data = [dict(zip(OUTPUT_KEYS, row)) for row in zip(period_dates, *metric_lists)]
     
     return {
         "symbol": symbol,
@@ -339,19 +509,100 @@ def extract_quarterly_data(stock_data: Dict) -> Optional[Dict]:
         "data": quarterly_data
     }
 
-def calculate_metrics_for_all_stocks(stocks: List[Dict]) -> tuple:
+def count_data_points(columns: Dict[str, np.ndarray]) -> Dict[str, int]:
+    """
+    Count the quarters that have a value for each metric reported in the data completeness summary
+    
+    Args:
+        columns: Mapping of metric -> float array, as returned by compute_metric_columns
+    
+    Returns:
+        Mapping of metric -> number of non-NaN values, for each metric in DATA_POINT_METRICS
+    """
+    return {metric: int(np.count_nonzero(~np.isnan(columns[metric]))) for metric in DATA_POINT_METRICS}
+
+def process_stock(stock_data: Dict) -> tuple:
+    """
+    Calculate metrics for a single stock, catching any error (runs in a worker process)
+    
+    Args:
+        stock_data: Dictionary containing stock data from data.jsonl
+    
+    Returns:
+        Tuple of (processed data or None, data point counts or None, error) where error is None on success,
+        or a tuple of (error type name, error message); data point counts are as returned by count_data_points
+    """
+    try:
+        metric_columns = compute_metric_columns(stock_data)
+        if metric_columns is None:
+            return None, None, None
+        return build_metrics_entry(*metric_columns), count_data_points(metric_columns[3]), None
+    except Exception as e:
+        return None, None, (type(e).__name__, str(e))
+
+def process_stock_chunk(chunk: List[Dict]) -> List[tuple]:
+    """
+    Run process_stock on a chunk of stocks (runs in a worker process)
+    
+    Args:
+        chunk: List of stock data dictionaries
+    
+    Returns:
+        List of the process_stock result of each stock, in chunk order
+    """
+    return [process_stock(stock_data) for stock_data in chunk]
+
+def map_process_stock(stocks: Iterable[Dict], max_workers: Optional[int] = None) -> Iterator[tuple]:
     """
-    Calculate metrics (total_return, forward_return) for all stocks
+    Run process_stock on every stock, in worker processes unless there are only a few stocks
+    
+    Stocks are taken from the iterable only as workers have room for them (at most
+    MAX_PENDING_TASKS_PER_WORKER tasks per worker are pending), so a stream of stocks that is
+    still being read is processed as it arrives, without reading all of it into memory first.
     
     Args:
-        stocks: List of stock data dictionaries from data.jsonl
+        stocks: Stock data dictionaries from data.jsonl (a list or any iterable, e.g. iter_data_from_jsonl)
+        max_workers: Maximum number of worker processes (default: None, one per CPU)
     
     Returns:
-        Tuple of (results list, statistics dictionary)
+        Iterator over (stock data, process_stock result) pairs, in input order
     """
-    results = []
-    stats = {
-        "total_stocks": len(stocks),
+    stock_iter = iter(stocks)
+    head = list(islice(stock_iter, PARALLEL_MIN_STOCKS))
+    if len(head) < PARALLEL_MIN_STOCKS:
+        for stock_data in head:
+            yield stock_data, process_stock(stock_data)
+        return
+    
+    num_workers = max_workers or os.cpu_count() or 1
+    if isinstance(stocks, list):
+        chunksize = max(1, len(stocks) // (num_workers * TASKS_PER_WORKER))
+    else:
+        chunksize = STREAM_CHUNKSIZE
+    max_pending = num_workers * MAX_PENDING_TASKS_PER_WORKER
+    
+    stock_iter = chain(head, stock_iter)
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        # Chunks are kept next to their futures to pair each result with its stock
+        pending = deque()
+        while chunk := list(islice(stock_iter, chunksize)):
+            if len(pending) >= max_pending:
+                done_chunk, future = pending.popleft()
+                yield from zip(done_chunk, future.result())
+            pending.append((chunk, executor.submit(process_stock_chunk, chunk)))
+        while pending:
+            done_chunk, future = pending.popleft()
+            yield from zip(done_chunk, future.result())
+
+def new_stats() -> Dict:
+    """
+    Create the statistics dictionary filled in by iter_stock_metrics
+    
+    Returns:
+        Statistics dictionary with all counters at zero
+    """
+    return {
+        "total_stocks": 0,
         "processed": 0,
         "skipped": 0,
         "errors": 0,
@@ -367,54 +618,52 @@ def calculate_metrics_for_all_stocks(stocks: List[Dict]) -> tuple:
         "forward_return_1y_data_points": 0,
         "forward_return_3y_data_points": 0,
         "forward_return_5y_data_points": 0,
-        "forward_return_10y_data_points": 0
+        "forward_return_10y_data_points": 0,
+        # Track errors for reporting
+        "error_details": {},
+        "error_examples": {}  # Store first few examples of each error type
     }
+
+def iter_stock_metrics(stocks: Iterable[Dict], stats: Dict, max_workers: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Calculate metrics for all stocks, yielding each processed stock as soon as it is ready
+    Stocks are independent, so they are processed in parallel across worker processes
+    (or serially, when there are fewer than PARALLEL_MIN_STOCKS stocks)
+    
+    Args:
+        stocks: Stock data dictionaries from data.jsonl (a list or any iterable, e.g. iter_data_from_jsonl)
+        stats: Statistics dictionary from new_stats, updated as stocks are processed
+            (complete once the iterator is exhausted)
+        max_workers: Maximum number of worker processes (default: None, one per CPU)
     
-    # Track errors for reporting
-    error_details = {}
-    error_examples = {}  # Store first few examples of each error type
+    Returns:
+        Iterator over the processed data of each stock with usable data, in input order
+    """
+    quarters_per_stock = stats["quarters_per_stock"]
+    error_details = stats["error_details"]
+    error_examples = stats["error_examples"]
     
-    for stock_data in stocks:
+    # Stocks are independent, so they are processed in parallel when there are enough of them
+    for stock_data, (processed_data, data_points, error) in map_process_stock(stocks, max_workers):
+        stats["total_stocks"] += 1
         symbol = stock_data.get("symbol", "Unknown")
-        try:
-            processed_data = extract_quarterly_data(stock_data)
+        if error is None:
             if processed_data:
-                results.append(processed_data)
+                num_quarters = len(processed_data["data"])
+                quarters_per_stock.append(num_quarters)
                 stats["processed"] += 1
-                num_quarters = len(processed_data.get("data", []))
                 stats["total_quarters"] += num_quarters
-                stats["quarters_per_stock"].append(num_quarters)
                 
-                # Count data completeness
-                for entry in processed_data.get("data", []):
-                    if entry.get("roa") is not None:
-                        stats["roa_data_points"] += 1
-                    if entry.get("ebit_ppe") is not None:
-                        stats["ebit_ppe_data_points"] += 1
-                    if entry.get("ebit_ppe_ttm") is not None:
-                        stats["ebit_ppe_ttm_data_points"] += 1
-                    if entry.get("gross_margin") is not None:
-                        stats["gross_margin_data_points"] += 1
-                    if entry.get("operating_margin") is not None:
-                        stats["operating_margin_data_points"] += 1
-                    if entry.get("ev_ebit") is not None:
-                        stats["ev_ebit_data_points"] += 1
-                    if entry.get("relative_ps") is not None:
-                        stats["relative_ps_data_points"] += 1
-                    if entry.get("forward_return_1y") is not None:
-                        stats["forward_return_1y_data_points"] += 1
-                    if entry.get("forward_return_3y") is not None:
-                        stats["forward_return_3y_data_points"] += 1
-                    if entry.get("forward_return_5y") is not None:
-                        stats["forward_return_5y_data_points"] += 1
-                    if entry.get("forward_return_10y") is not None:
-                        stats["forward_return_10y_data_points"] += 1
+                # Count data completeness (counted by the worker from the metric arrays)
+                for metric, count in data_points.items():
+                    stats[f"{metric}_data_points"] += count
+                
+                yield processed_data
             else:
                 stats["skipped"] += 1
-        except Exception as e:
+        else:
             stats["errors"] += 1
-            error_type = type(e).__name__
-            error_msg = str(e)
+            error_type, error_msg = error
             
             # Track error types
             if error_type not in error_details:
@@ -428,60 +677,73 @@ def calculate_metrics_for_all_stocks(stocks: List[Dict]) -> tuple:
                     "symbol": symbol,
                     "error": error_msg
                 })
-    
-    # Add error details to stats
-    stats["error_details"] = error_details
-    stats["error_examples"] = error_examples
-    
-    return results, stats
 
-def save_metrics_to_json(metrics_data: List[Dict], filename: str = "metrics.json"):
+def save_metrics_to_json(metrics_data: Iterable[Dict], filename: str = "metrics.json") -> int:
     """
     Save calculated metrics to JSON file
     
+    Stocks are serialized and written one at a time as metrics_data yields them, so it can be
+    an iterator (e.g. iter_stock_metrics) and the full results never need to be held in memory.
+    The file is written to a temporary file first and only replaces filename if at least one
+    stock was written, so an existing metrics.json is kept when no metrics were calculated.
+    
     Args:
-        metrics_data: List of dictionaries containing metrics for each stock
+        metrics_data: Iterable of dictionaries containing metrics for each stock
         filename: Output filename
+    
+    Returns:
+        Number of stocks saved
     """
+    temp_filename = filename + ".tmp"
+    count = 0
     try:
-        # Create output data with period, total_return, forward_return, roa, ebit_ppe, ebit_ppe_ttm, gross_margin, operating_margin, ev_ebit, and relative_ps
-        output_data = []
-        for stock_data in metrics_data:
-            output_stock = {
-                "symbol": stock_data.get("symbol"),
-                "company_name": stock_data.get("company_name"),
-                "data": []
-            }
-            
-            # Include period, total_return, forward_return (total to end, annualized), forward returns (1y, 3y, 5y, 10y, all annualized), roa, ebit_ppe, ebit_ppe_ttm, gross_margin, operating_margin, ev_ebit, and relative_ps in the output
-            for entry in stock_data.get("data", []):
-                output_entry = {
-                    "period": entry.get("period"),
-                    "total_return": entry.get("total_return"),
-                    "forward_return": entry.get("forward_return"),  # Annualized return from period j+1 to most recent period
-                    "forward_return_1y": entry.get("forward_return_1y"),  # Annualized 1-year forward return
-                    "forward_return_3y": entry.get("forward_return_3y"),  # Annualized 3-year forward return
-                    "forward_return_5y": entry.get("forward_return_5y"),  # Annualized 5-year forward return
-                    "forward_return_10y": entry.get("forward_return_10y"),  # Annualized 10-year forward return
-                    "roa": entry.get("roa"),
-                    "ebit_ppe": entry.get("ebit_ppe"),  # Operating income / PPE (quarterly)
-                    "ebit_ppe_ttm": entry.get("ebit_ppe_ttm"),  # TTM Operating income / TTM PPE (4 trailing quarters)
-                    "gross_margin": entry.get("gross_margin"),  # (Revenue - COGS) / Revenue
-                    "operating_margin": entry.get("operating_margin"),  # Operating Income / Revenue
-                    "ev_ebit": entry.get("ev_ebit"),  # Enterprise Value / EBIT (Operating Income)
-                    "relative_ps": entry.get("relative_ps")  # Current Price-to-Sales / 5-Year Average Price-to-Sales
-                }
-                output_stock["data"].append(output_entry)
+        f = open(temp_filename, 'wb')
+    except OSError as e:
+        print(f"Error saving to {filename}: {e}")
+        return 0
+    
+    try:
+        with f:
+            # Stocks from build_metrics_entry already have the output shape (symbol, company_name, data)
+            # with entries holding exactly the output keys, so they are written as is without a copy
+            # metrics.json is only read by other scripts, so it is written compactly (no indentation)
+            # Errors raised by metrics_data itself (e.g. a failed worker process) propagate to the caller;
+            # only errors serializing or writing the stocks are reported as save errors
+            for stock in metrics_data:
+                try:
+                    f.write(b',' if count else b'[')
+                    if orjson is not None:
+                        f.write(orjson.dumps(stock))
+                    else:
+                        f.write(json.dumps(stock, separators=(',', ':')).encode())
+                except (OSError, TypeError, ValueError) as e:
+                    print(f"Error saving to {filename}: {e}")
+                    return 0
+                count += 1
             
-            output_data.append(output_stock)
-        
-        with open(filename, 'w') as f:
-            json.dump(output_data, f, indent=2)
+            if not count:
+                return 0
+            try:
+                f.write(b']')
+                f.flush()
+            except OSError as e:
+                print(f"Error saving to {filename}: {e}")
+                return 0
         
-        print(f"\nMetrics saved to {filename}")
-        print(f"Saved metrics for {len(output_data)} stock(s)")
-    except Exception as e:
-        print(f"Error saving to {filename}: {e}")
+        try:
+            os.replace(temp_filename, filename)
+        except OSError as e:
+            print(f"Error saving to {filename}: {e}")
+            return 0
+    finally:
+        # Remove the temporary file unless it replaced filename (nothing to save, saving failed,
+        # or metrics_data raised)
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+    
+    print(f"\nMetrics saved to {filename}")
+    print(f"Saved metrics for {count} stock(s)")
+    return count
 
 def main():
     """
@@ -490,27 +752,25 @@ def main():
     print("Calculating Metrics from data.jsonl")
     print("=" * 80)
     
-    # Load data from data.jsonl
-    print("\nLoading data from data.jsonl...")
-    stocks = load_data_from_jsonl("data.jsonl")
-    
-    if not stocks:
-        print("No stock data found in data.jsonl")
+    if not os.path.exists("data.jsonl"):
+        print("Error: data.jsonl not found")
         return
     
-    print(f"Found {len(stocks)} stock(s) in data.jsonl\n")
+    # Stocks are read from data.jsonl (or its cache) and processed as a pipeline: workers start on the
+    # first stocks while the rest of the file is still being read, and each stock is written to
+    # metrics.json as soon as it is processed, so only the stocks in flight are held in memory
+    print("\nCalculating metrics (total_return, forward_return, forward returns 1y/3y/5y/10y, ROA, EBIT/PPE, EBIT/PPE TTM, Gross Margin, Operating Margin, EV/EBIT, Relative PS)...")
+    stats = new_stats()
+    num_saved = save_metrics_to_json(iter_stock_metrics(iter_data_from_jsonl("data.jsonl"), stats), "metrics.json")
     
-    # Calculate metrics for all stocks
-    print("Calculating metrics (total_return, forward_return, forward returns 1y/3y/5y/10y, ROA, EBIT/PPE, EBIT/PPE TTM, Gross Margin, Operating Margin, EV/EBIT, Relative PS)...")
-    metrics_data, stats = calculate_metrics_for_all_stocks(stocks)
+    if not stats["total_stocks"]:
+        print("No stock data found in data.jsonl")
+        return
     
-    if not metrics_data:
+    if not num_saved:
         print("\nNo metrics were successfully calculated.")
         return
     
-    # Save to metrics.json
-    save_metrics_to_json(metrics_data, "metrics.json")
-    
     # Print summary statistics
     print(f"\n{'='*80}")
     print("PROCESSING SUMMARY")
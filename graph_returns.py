@@ -2,11 +2,22 @@
 Program to graph total return over time for each ticker from data.json
 """
 import json
+import os
+import argparse
 import matplotlib.pyplot as plt
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 import numpy as np
 
+# orjson parses JSON several times faster than the standard library; it is optional
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Resolution used when saving graphs to files
+SAVE_DPI = 150
+
 def load_data(filename: str = "data.json") -> List[Dict]:
     """
     Load total return data from JSON file
@@ -18,6 +29,9 @@ def load_data(filename: str = "data.json") -> List[Dict]:
         List of dictionaries containing stock data
     """
     try:
+        if orjson is not None:
+            with open(filename, 'rb') as f:
+                return orjson.loads(f.read())
         with open(filename, 'r') as f:
             return json.load(f)
     except FileNotFoundError:
@@ -75,22 +89,49 @@ def calculate_cumulative_returns(returns: List[float]) -> List[float]:
     
     return cumulative
 
-def graph_total_returns(data: List[Dict]):
+def finish_graph(symbol: str, output_dir: Optional[str], suffix: str):
+    """
+    Display the current graph, or save it to a file when an output directory is given
+    
+    Args:
+        symbol: Stock symbol the graph is for
+        output_dir: Directory to save the graph in, or None to display it
+        suffix: Suffix for the saved file name (e.g., "total_return")
+    """
+    if output_dir is None:
+        # Display the graph (blocks until window is closed)
+        print(f"Displaying graph for {symbol} - Close the window to see the next one...")
+        plt.show()
+        
+        # Close the figure after window is closed
+        plt.close()
+    else:
+        path = os.path.join(output_dir, f"{symbol}_{suffix}.png")
+        plt.savefig(path, dpi=SAVE_DPI)
+        print(f"Saved graph for {symbol} to {path}")
+
+def graph_total_returns(data: List[Dict], output_dir: Optional[str] = None):
     """
     Graph cumulative total return over time for each ticker (one graph per ticker)
     Displays graphs as popups sequentially - close one to see the next
     
+    When output_dir is given, graphs are saved there instead, and a single figure is
+    cleared and redrawn for every ticker rather than allocating a new figure each time.
+    
     Args:
         data: List of dictionaries containing stock data
+        output_dir: Directory to save graphs in (default: None, display them)
     """
     if not data:
         print("No data to graph")
         return
     
+    fig = plt.figure(figsize=(14, 8)) if output_dir is not None else None
+    
     for stock_data in data:
         symbol = stock_data.get("symbol", "Unknown")
         company_name = stock_data.get("company_name", symbol)
-        quarterly_data = stock_data.get("data", [])
+        quarterly_data = stock_data.get("data") or ()
         
         if not quarterly_data:
             print(f"Skipping {symbol}: No data")
@@ -115,8 +156,11 @@ def graph_total_returns(data: List[Dict]):
         # Calculate cumulative returns
         cumulative_returns = calculate_cumulative_returns(returns)
         
-        # Create a new figure for each ticker
-        plt.figure(figsize=(14, 8))
+        # Create a new figure for each displayed ticker, or reuse the figure when saving
+        if fig is None:
+            plt.figure(figsize=(14, 8))
+        else:
+            fig.clf()
         
         # Plot the line
         plt.plot(periods, cumulative_returns, label=f"{symbol} ({company_name})", 
@@ -155,29 +199,33 @@ def graph_total_returns(data: List[Dict]):
         # Adjust layout to prevent label cutoff
         plt.tight_layout()
         
-        # Display the graph (blocks until window is closed)
-        print(f"Displaying graph for {symbol} - Close the window to see the next one...")
-        plt.show()
-        
-        # Close the figure after window is closed
-        plt.close()
+        finish_graph(symbol, output_dir, "total_return")
+    
+    if fig is not None:
+        plt.close(fig)
 
-def graph_period_returns(data: List[Dict]):
+def graph_period_returns(data: List[Dict], output_dir: Optional[str] = None):
     """
     Graph period-by-period total return for each ticker (one graph per ticker)
     Displays graphs as popups sequentially - close one to see the next
     
+    When output_dir is given, graphs are saved there instead, and a single figure is
+    cleared and redrawn for every ticker rather than allocating a new figure each time.
+    
     Args:
         data: List of dictionaries containing stock data
+        output_dir: Directory to save graphs in (default: None, display them)
     """
     if not data:
         print("No data to graph")
         return
     
+    fig = plt.figure(figsize=(14, 8)) if output_dir is not None else None
+    
     for stock_data in data:
         symbol = stock_data.get("symbol", "Unknown")
         company_name = stock_data.get("company_name", symbol)
-        quarterly_data = stock_data.get("data", [])
+        quarterly_data = stock_data.get("data") or ()
         
         if not quarterly_data:
             continue
@@ -197,8 +245,12 @@ def graph_period_returns(data: List[Dict]):
         if not periods:
             continue
         
-        # Create a new figure for each ticker
-        fig, ax = plt.subplots(figsize=(14, 8))
+        # Create a new figure for each displayed ticker, or reuse the figure when saving
+        if fig is None:
+            _, ax = plt.subplots(figsize=(14, 8))
+        else:
+            fig.clf()
+            ax = fig.add_subplot()
         
         # Create bar plot
         ax.bar(periods, returns, color='#1f77b4', alpha=0.7, width=60)
@@ -216,17 +268,26 @@ def graph_period_returns(data: List[Dict]):
         
         plt.tight_layout()
         
-        # Display the graph (blocks until window is closed)
-        print(f"Displaying graph for {symbol} - Close the window to see the next one...")
-        plt.show()
-        
-        # Close the figure after window is closed
-        plt.close()
+        finish_graph(symbol, output_dir, "period_returns")
+    
+    if fig is not None:
+        plt.close(fig)
 
 def main():
     """
     Main function to load data and create graphs
     """
+    parser = argparse.ArgumentParser(description='Graph total return over time for each ticker')
+    parser.add_argument(
+        '--save',
+        metavar='DIR',
+        help='Save graphs as PNG files in DIR instead of displaying them one at a time'
+    )
+    args = parser.parse_args()
+    
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+    
     print("Loading data from data.json...")
     data = load_data("data.json")
     
@@ -237,16 +298,16 @@ def main():
     print(f"Loaded data for {len(data)} stock(s)")
     for stock in data:
         symbol = stock.get("symbol", "Unknown")
-        num_periods = len(stock.get("data", []))
+        num_periods = len(stock.get("data") or ())
         print(f"  - {symbol}: {num_periods} periods")
     
     # Create cumulative returns graph for each ticker
     print("\nCreating cumulative returns graphs (one per ticker)...")
-    graph_total_returns(data)
+    graph_total_returns(data, args.save)
     
     # Optionally create period returns graph for each ticker
     # print("\nCreating period returns graphs (one per ticker)...")
-    # graph_period_returns(data)
+    # graph_period_returns(data, args.save)
 
 if __name__ == "__main__":
     main()
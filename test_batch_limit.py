@@ -2,6 +2,8 @@
 from quickfs import QuickFS
 from config import QUICKFS_API_KEY
 import json
+import sys
+import time
 
 client = QuickFS(QUICKFS_API_KEY)
 
@@ -12,32 +14,91 @@ with open('tickers.json', 'r') as f:
 
 print(f"Total tickers available: {len(all_tickers)}")
 
-# Test with different batch sizes
-test_sizes = [10, 50, 100, 500, 1000, 2000, 3600]
-
 metrics = ['period_end_price', 'dividends', 'period_end_date', 'roa']
 period = 'FQ-10:FQ'  # Use fewer periods for testing
 
-for size in test_sizes:
-    if size > len(all_tickers):
-        print(f"\nSkipping {size} (exceeds available tickers)")
-        continue
+# First batch size tried; sizes double from here until a batch is rejected as too large
+START_SIZE = 10
+
+# Attempts per batch size for errors that say nothing about the batch size (rate limits, timeouts,
+# server errors), and the delay before the first retry (doubled on each retry)
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 5.0
+
+# Words in a 400 response body that mark it as a rejection of the batch size
+BATCH_SIZE_ERROR_WORDS = ('batch', 'too many', 'too large', 'limit', 'size')
+
+def is_batch_size_error(e):
+    """Return True if the error is the API rejecting the batch as too large (413, or a 400 about the size)"""
+    response = getattr(e, 'response', None)
+    status_code = getattr(response, 'status_code', None)
+    if status_code == 413:
+        return True
+    if status_code == 400:
+        text = (response.text or '').lower()
+        return any(word in text for word in BATCH_SIZE_ERROR_WORDS)
+    return False
+
+def try_batch(size):
+    """
+    Request a batch of the first `size` tickers
     
+    Returns True if the request succeeds and False if the API rejects the batch as too large.
+    Any other error is retried; if it persists the search cannot tell whether the size is over
+    the limit, so the script stops instead of recording a wrong limit.
+    """
     print(f"\nTesting batch size: {size}")
     test_tickers = [f"{t}:US" for t in all_tickers[:size]]
     
-    try:
-        result = client.get_data_batch(test_tickers, metrics, period)
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            result = client.get_data_batch(test_tickers, metrics, period)
+        except Exception as e:
+            if is_batch_size_error(e):
+                print(f"  Rejected as too large: {e}")
+                return False
+            print(f"  Error: {e}")
+            if attempt + 1 < MAX_ATTEMPTS:
+                delay = RETRY_DELAY * (2 ** attempt)
+                print(f"  Retrying in {delay:.0f}s...")
+                time.sleep(delay)
+            continue
         
         # Count successful tickers
         if result and 'period_end_date' in result:
             successful = len([k for k in result['period_end_date'].keys()])
             print(f"  Success! Got data for {successful} tickers")
-        else:
-            print(f"  Warning: Unexpected response format")
-            
-    except Exception as e:
-        print(f"  Error: {e}")
-        print(f"  Maximum batch size appears to be less than {size}")
+            return True
+        print(f"  Warning: Unexpected response format")
         break
+    
+    print(f"\nCould not determine whether a batch of {size} is within the limit; stopping")
+    sys.exit(1)
+
+# Galloping search: double the batch size until one is rejected, then bisect between the last
+# size that succeeded and the first that failed. Every request is at most about twice the limit,
+# so the tickers requested stay proportional to the limit rather than to the ticker count
+best = 0
+size = min(START_SIZE, len(all_tickers))
+while size and try_batch(size):
+    best = size
+    if size == len(all_tickers):
+        break
+    size = min(size * 2, len(all_tickers))
+
+if best < len(all_tickers):
+    lo, hi = best + 1, size - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if try_batch(mid):
+            best = mid
+            lo = mid + 1
+        else:
+            hi = mid - 1
 
+if best == len(all_tickers):
+    print(f"\nAll {best} tickers fit in a single batch")
+elif best:
+    print(f"\nMaximum batch size: {best}")
+else:
+    print("\nEven a batch of 1 ticker failed")